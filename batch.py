@@ -0,0 +1,188 @@
+"""
+Schedules many inputs (e.g. one for every department) in one shared pool of processes. Every job loads its input,
+runs the algorithm with its own time limit and writes its solution in the worker, so only statistics are sent back.
+Results are reported as soon as jobs finish and at most a fixed number of jobs is submitted to the pool at once, so
+memory does not depend on the number of inputs.
+"""
+import argparse
+import copy
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from model import Config
+from scheduler import solve
+from utils import load_data, write_solution_to_file, write_solution_jsonl
+
+
+def read_jobs(source, output_dir='solution_files', solution_format='text'):
+    """
+    Generates jobs from directory (every file in it is an input) or manifest file. Every line of manifest is a path
+    to an input or a JSON object with key input and optional keys output, time_limit and seed; relative paths are
+    relative to the manifest.
+    :return: generator of dictionaries with keys input, output and optionally time_limit and seed
+    """
+    extension = '.jsonl' if solution_format == 'jsonl' else ''
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            path = os.path.join(source, name)
+            if os.path.isfile(path):
+                yield {'input': path, 'output': os.path.join(output_dir, 'sol_' + name + extension)}
+        return
+
+    base = os.path.dirname(source)
+    with open(source) as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('{'):
+                try:
+                    job = json.loads(line)
+                except ValueError as e:
+                    raise ValueError('{}:{}: invalid JSON: {}'.format(source, number, e))
+                if 'input' not in job:
+                    raise ValueError('{}:{}: missing key input'.format(source, number))
+            else:
+                job = {'input': line}
+            job['input'] = os.path.join(base, job['input'])
+            if 'output' in job:
+                job['output'] = os.path.join(base, job['output'])
+            else:
+                job['output'] = os.path.join(output_dir, 'sol_' + os.path.basename(job['input']) + extension)
+            yield job
+
+
+def run_job(job, config, cache_dir=None, solution_format='text'):
+    """
+    Loads input of the job, runs the algorithm and writes the solution.
+    :return: dictionary with input, output, status ('ok' or 'error'), seconds, and statistics and stop_reason (see
+    Result) or error
+    """
+    start = time.perf_counter()
+    record = {'input': job['input'], 'output': job['output']}
+    try:
+        config = copy.copy(config)
+        if 'time_limit' in job:
+            config.time_limit = job['time_limit']
+        if 'seed' in job:
+            config.seed = job['seed']
+        data = load_data(job['input'], {}, {}, {}, seed=config.seed or 0, cache_dir=cache_dir)
+        result = solve(data, config)
+        if os.path.dirname(job['output']):
+            os.makedirs(os.path.dirname(job['output']), exist_ok=True)
+        if solution_format == 'jsonl':
+            write_solution_jsonl(data, result.filled, job['output'], result.statistics)
+        else:
+            write_solution_to_file(result.matrix, data, result.filled, job['output'], result.groups_empty_space,
+                                   result.teachers_empty_space, result.subjects_order)
+        record.update(status='ok', statistics=result.statistics, stop_reason=result.stop_reason)
+    except Exception as e:
+        record.update(status='error', error='{}: {}'.format(type(e).__name__, e))
+    record['seconds'] = time.perf_counter() - start
+    return record
+
+
+def _run_job(args):
+    return run_job(*args)
+
+
+def run_batch(jobs, config=None, processes=None, cache_dir=None, solution_format='text', window=None):
+    """
+    Runs jobs in a pool of processes.
+    :param jobs: iterable of jobs (see read_jobs), it is consumed only as jobs are submitted
+    :param config: parameters of the algorithm shared by all jobs (Config), time_limit and seed of a job override it
+    :param processes: number of processes, by default number of CPUs
+    :param window: maximum number of jobs submitted to the pool at once, by default twice the number of processes
+    :return: generator of results of jobs (see run_job) in order in which they finish
+    """
+    if config is None:
+        config = Config()
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if window is None:
+        window = 2 * processes
+
+    finished = queue.Queue()
+    with multiprocessing.Pool(processes) as pool:
+        pending = 0
+        for job in jobs:
+            if pending >= window:
+                yield finished.get()
+                pending -= 1
+            pool.apply_async(_run_job, ((job, config, cache_dir, solution_format),), callback=finished.put,
+                             error_callback=lambda e, job=job: finished.put(
+                                 {'input': job['input'], 'output': job['output'], 'status': 'error',
+                                  'error': '{}: {}'.format(type(e).__name__, e), 'seconds': 0.0}))
+            pending += 1
+        while pending:
+            yield finished.get()
+            pending -= 1
+
+
+def summary_table(records):
+    """
+    Returns table with one row for every job: statistics of its timetable, time and why it stopped early.
+    :param records: results of jobs (see run_job)
+    """
+    lines = ['| Input | Hard constraints | Soft constraints | Average idle for groups | Average idle for teachers '
+             '| Free hour | Time [s] | Stopped |',
+             '| ----- | ---------------- | ---------------- | ----------------------- | ------------------------- '
+             '| --------- | -------- | ------- |']
+    for record in sorted(records, key=lambda record: record['input']):
+        name = os.path.basename(record['input'])
+        if record['status'] != 'ok':
+            lines.append('| {} | error: {} | | | | | {:.1f} | |'.format(name, record['error'], record['seconds']))
+            continue
+        s = record['statistics']
+        lines.append('| {} | {} | {:.02f}% | {:.02f} | {:.02f} | {} | {:.1f} | {} |'.format(
+            name, '100%' if s['hard_cost'] == 0 else 'cost {}'.format(s['hard_cost']), s['soft_satisfied'],
+            s['groups_average'], s['teachers_average'], 'none' if s['free_hour'] == -1 else s['free_hour'],
+            record['seconds'], record['stop_reason'] or ''))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Schedules all inputs from a directory or manifest in a shared pool '
+                                                 'of processes.')
+    parser.add_argument('source', help='directory with input files or manifest (one path or JSON object per line)')
+    parser.add_argument('--output-dir', default='solution_files',
+                        help='directory for solutions of jobs without output in the manifest')
+    parser.add_argument('--format', choices=['text', 'jsonl'], default='text', help='format of solution files')
+    parser.add_argument('--processes', type=int, default=None, help='number of processes, by default number of CPUs')
+    parser.add_argument('--time-limit', type=float, default=None, help='time limit for every job in seconds')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cache-dir', help='directory where compiled input data is cached')
+    parser.add_argument('--results', help='append result of every job as JSON line to this file')
+    args = parser.parse_args()
+    config = Config(seed=args.seed, time_limit=args.time_limit)
+
+    jobs = read_jobs(args.source, args.output_dir, args.format)
+    results_file = open(args.results, 'a') if args.results else None
+    # only small records of finished jobs are kept for the summary
+    records = []
+    try:
+        for record in run_batch(jobs, config, args.processes, args.cache_dir, args.format):
+            records.append(record)
+            if results_file is not None:
+                results_file.write(json.dumps(record) + '\n')
+                results_file.flush()
+            if record['status'] == 'ok':
+                print('{}: hard cost {}, average idle for groups {:.02f}, {:.1f} s'.format(
+                    record['input'], record['statistics']['hard_cost'], record['statistics']['groups_average'],
+                    record['seconds']), flush=True)
+            else:
+                print('{}: {}'.format(record['input'], record['error']), file=sys.stderr, flush=True)
+    finally:
+        if results_file is not None:
+            results_file.close()
+
+    print('\n' + summary_table(records))
+    if any(record['status'] != 'ok' for record in records):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+"""
+Benchmark of the algorithm on synthetic inputs of configurable size. Every phase is timed separately and results are
+appended as one JSON line to the results file, so that runs on different versions of the code can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from costs import hard_constraints_cost, check_hard_constraints, empty_space_groups_cost, \
+    empty_space_teachers_cost, free_hour, subjects_order_cost
+from scheduler import initial_population, evolutionary_algorithm, simulated_hardening
+from utils import load_data, set_up
+from model import SubjectsOrder
+
+
+def generate_input(num_of_classes, num_of_groups, num_of_teachers, num_of_rooms, durations=None, seed=None):
+    """
+    Generates input in the same format as files in test_files/. Groups are divided into 4 years, every subject belongs
+    to one year and has lectures (P) for several least busy groups of the year, exercises (V) for smaller parts of
+    those groups and sometimes laboratory exercises (L). Teachers are assigned in turns, so that they have similar
+    number of classes.
+    :param durations: dictionary where key = duration in hours, value = relative frequency
+    :return: dictionary with 'Ucionice' and 'Casovi'
+    """
+    rnd = random.Random(seed)
+    if durations is None:
+        durations = {1: 1, 2: 4, 3: 3, 4: 1}
+    hours = list(durations)
+    weights = [durations[h] for h in hours]
+
+    # classrooms for lectures (n), exercises (r) and laboratory exercises (l)
+    num_of_labs = max(1, num_of_rooms // 5)
+    num_of_halls = max(1, (num_of_rooms - num_of_labs) * 2 // 5)
+    num_of_small = max(1, num_of_rooms - num_of_labs - num_of_halls)
+    classrooms = {
+        'n': ['N{}'.format(i + 1) for i in range(num_of_halls)],
+        'r': ['R{}'.format(i + 1) for i in range(num_of_small)],
+        'l': ['L{}'.format(i + 1) for i in range(num_of_labs)],
+    }
+
+    groups = ['{}{:02d}'.format(i % 4 + 1, i // 4 + 1) for i in range(num_of_groups)]
+    years = [[g for g in groups if g[0] == str(year)] for year in range(1, 5)]
+    years = [year for year in years if year]
+    teachers = ['Teacher {}'.format(i + 1) for i in range(num_of_teachers)]
+
+    classes = []
+    # load: dictionary where key = name of the group, value = total hours of its classes
+    load = {g: 0 for g in groups}
+    subject = 0
+    while len(classes) < num_of_classes:
+        subject += 1
+        name = 'Subject {}'.format(subject)
+        year = rnd.choice(years)
+        attending = sorted(year, key=lambda g: (load[g], rnd.random()))[:rnd.randint(1, max(1, len(year) // 2))]
+        new = [('P', attending, 'n')]
+        # exercises and laboratory exercises for parts of attending groups
+        size = rnd.randint(1, 3)
+        for i in range(0, len(attending), size):
+            new.append(('V', attending[i:i + size], 'r'))
+            if rnd.random() < 0.3:
+                new.append(('L', attending[i:i + size], 'l'))
+
+        for type, class_groups, room in new[:num_of_classes - len(classes)]:
+            duration = rnd.choices(hours, weights)[0]
+            for g in class_groups:
+                load[g] += duration
+            classes.append({
+                'Predmet': name,
+                'Tip': type,
+                'Nastavnik': teachers[len(classes) % num_of_teachers],
+                'Grupe': class_groups,
+                'Ucionica': room,
+                'Trajanje': str(duration),
+            })
+
+    return {'Ucionice': classrooms, 'Casovi': classes}
+
+
+def peak_memory():
+    """
+    Returns peak memory (maximum resident set size) of the process so far in kilobytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # on macOS the value is in bytes
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+class MoveCounter:
+    """
+    Progress callback that counts moves of classes attempted by the algorithm, and accepted ones if it reports them,
+    as reported at the end of its phase.
+    """
+
+    def __init__(self):
+        self.moves = 0
+        self.accepted = None
+
+    def __call__(self, event):
+        if event['event'] != 'phase_end':
+            return
+        if 'moves' in event:
+            self.moves += event['moves']
+        elif 'steps' in event:
+            # every step of simulated hardening is one attempted move
+            self.moves += event['steps']
+            self.accepted = (self.accepted or 0) + event['accepted']
+
+
+def measure(name, function, results, moves=None, repeat=1):
+    """
+    Calls function given number of times and appends its duration, throughput and peak memory to results.
+    :param moves: MoveCounter passed to the function as its progress callback
+    :return: result of the last call
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    seconds = time.perf_counter() - start
+
+    measurement = {'phase': name, 'seconds': seconds, 'peak_memory_kb': peak_memory()}
+    if repeat > 1:
+        measurement['evals_per_second'] = repeat / seconds
+    if moves is not None:
+        measurement['moves'] = moves.moves
+        measurement['moves_per_second'] = moves.moves / seconds
+        if moves.accepted is not None:
+            measurement['accepted_moves'] = moves.accepted
+    results.append(measurement)
+    return result
+
+
+def run_benchmark(path, seed=0, cost_repeat=20):
+    """
+    Runs and times all phases of the algorithm on input file.
+    :return: list of measurements, one for each phase
+    """
+    random.seed(seed)
+    results = []
+    filled, subjects_order, groups_empty_space, teachers_empty_space = {}, SubjectsOrder(), {}, {}
+
+    data = measure('load_data', lambda: load_data(path, teachers_empty_space, groups_empty_space, subjects_order),
+                   results)
+    matrix, free = set_up(len(data.classrooms))
+    measure('initial_population', lambda: initial_population(data, matrix, free, filled, groups_empty_space,
+                                                              teachers_empty_space, subjects_order), results)
+
+    cost_functions = [
+        ('hard_constraints_cost', lambda: hard_constraints_cost(matrix, data)),
+        ('check_hard_constraints', lambda: check_hard_constraints(matrix, data)),
+        ('empty_space_groups_cost', lambda: empty_space_groups_cost(groups_empty_space)),
+        ('empty_space_teachers_cost', lambda: empty_space_teachers_cost(teachers_empty_space)),
+        ('free_hour', lambda: free_hour(matrix)),
+        ('subjects_order_cost', lambda: subjects_order_cost(subjects_order)),
+    ]
+    for name, function in cost_functions:
+        measure(name, function, results, repeat=cost_repeat)
+
+    moves = MoveCounter()
+    measure('evolutionary_algorithm', lambda: evolutionary_algorithm(
+        matrix, data, free, filled, groups_empty_space, teachers_empty_space, subjects_order, progress=moves),
+        results, moves)
+    results[-1]['hard_cost'] = check_hard_constraints(matrix, data)
+
+    moves = MoveCounter()
+    measure('simulated_hardening', lambda: simulated_hardening(
+        matrix, data, free, filled, groups_empty_space, teachers_empty_space, subjects_order, progress=moves),
+        results, moves)
+    results[-1]['groups_average'] = empty_space_groups_cost(groups_empty_space)[2]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the algorithm on synthetic or given input.')
+    parser.add_argument('--input', help='input file, if not given synthetic input is generated')
+    parser.add_argument('--classes', type=int, default=400)
+    parser.add_argument('--groups', type=int, default=60)
+    parser.add_argument('--teachers', type=int, default=100)
+    parser.add_argument('--rooms', type=int, default=25)
+    parser.add_argument('--durations', default='1:1,2:4,3:3,4:1',
+                        help='relative frequencies of durations as duration:weight,...')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save-input', help='path where generated input is saved')
+    parser.add_argument('--output', default='benchmark_results.jsonl', help='file to which results are appended')
+    args = parser.parse_args()
+
+    parameters = {'seed': args.seed}
+    path = args.input
+    if path is None:
+        durations = {int(d): float(w) for d, w in (item.split(':') for item in args.durations.split(','))}
+        generated = generate_input(args.classes, args.groups, args.teachers, args.rooms, durations, args.seed)
+        path = args.save_input or os.path.join(tempfile.mkdtemp(), 'synthetic.txt')
+        with open(path, 'w') as file:
+            json.dump(generated, file)
+        parameters.update(classes=args.classes, groups=args.groups, teachers=args.teachers, rooms=args.rooms,
+                          durations=args.durations)
+    else:
+        parameters['input'] = path
+
+    results = run_benchmark(path, args.seed)
+    record = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'parameters': parameters,
+        'results': results,
+    }
+    with open(args.output, 'a') as file:
+        file.write(json.dumps(record) + '\n')
+
+    for measurement in results:
+        print('{:28s} {:10.4f} s'.format(measurement['phase'], measurement['seconds']))
+
+
+if __name__ == '__main__':
+    main()
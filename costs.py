@@ -1,9 +1,43 @@
+# terms of the soft constraints cost optimised by simulated hardening, see soft_cost_terms
+SOFT_TERMS = ('groups', 'teachers', 'max_gap', 'order', 'free_hour')
+
+
+def order_violations(times):
+    """
+    Counts orders of types of classes (P before V, P before L, V before L) of one subject and group. Order of two types
+    is violated if the last class of the first type starts after the first class of the second type.
+    :param times: [P start times, V start times, L start times], each sorted, empty if the subject does not have that
+    type of class
+    :return: number of violated orders, number of all orders
+    """
+    cost = 0
+    total = 0
+
+    if times[0] and times[1]:
+        total += 1
+        # P after V
+        if times[0][-1] > times[1][0]:
+            cost += 1
+
+    if times[0] and times[2]:
+        total += 1
+        # P after L
+        if times[0][-1] > times[2][0]:
+            cost += 1
+
+    if times[1] and times[2]:
+        total += 1
+        # V after L
+        if times[1][-1] > times[2][0]:
+            cost += 1
+
+    return cost, total
+
+
 def subjects_order_cost(subjects_order):
     """
     Calculates percentage of soft constraints - order of subjects (P, V, L).
-    :param subjects_order: dictionary where key = (name of the subject, index of the group), value = [int, int, int]
-    where ints represent start times (row in matrix) for types of classes P, V and L respectively. If start time is -1
-    it means that that subject does not have that type of class.
+    :param subjects_order: SubjectsOrder, start times of classes of every subject and group by type of class
     :return: percentage of satisfied constraints
     """
     # number of subjects not in right order
@@ -11,28 +45,42 @@ def subjects_order_cost(subjects_order):
     # number of all orders of subjects
     total = 0
 
-    for (subject, group_index), times in subjects_order.items():
-
-        if times[0] != -1 and times[1] != -1:
-            total += 1
-            # P after V
-            if times[0] > times[1]:
-                cost += 1
+    for times in subjects_order.values():
+        violated, orders = order_violations(times)
+        cost += violated
+        total += orders
 
-        if times[0] != -1 and times[2] != -1:
-            total += 1
-            # P after L
-            if times[0] > times[2]:
-                cost += 1
+    return 100 * (total - cost) / total
 
-        if times[1] != -1 and times[2] != -1:
-            total += 1
-            # V after L
-            if times[1] > times[2]:
-                cost += 1
 
-    # print(cost, total)
-    return 100 * (total - cost) / total
+def soft_cost_terms(matrix, subjects_order, groups_empty_space, teachers_empty_space):
+    """
+    Calculates terms of the soft constraints cost (see SOFT_TERMS): average empty space of groups and of teachers per
+    week, maximum empty space of a group or a teacher in one day, share of violated orders of subjects and 1 if there
+    is no hour without classes (0 otherwise).
+    :return: dictionary where key = term, value = its value
+    """
+    _, groups_max, groups_average = empty_space_groups_cost(groups_empty_space)
+    _, teachers_max, teachers_average = empty_space_teachers_cost(teachers_empty_space)
+    violated = total = 0
+    for times in subjects_order.values():
+        cost, orders = order_violations(times)
+        violated += cost
+        total += orders
+    return {
+        'groups': groups_average,
+        'teachers': teachers_average,
+        'max_gap': max(groups_max, teachers_max),
+        'order': violated / total if total else 0.0,
+        'free_hour': 1 if free_hour(matrix) == -1 else 0,
+    }
+
+
+def weighted_soft_cost(terms, weights):
+    """
+    Returns sum of terms of the soft constraints cost multiplied by their weights (terms without weight are ignored).
+    """
+    return sum(weight * terms[term] for term, weight in weights.items() if weight)
 
 
 def empty_space_groups_cost(groups_empty_space):
@@ -73,7 +121,7 @@ def empty_space_teachers_cost(teachers_empty_space):
     """
     Calculates total empty space of all teachers for week, maximum empty space in day and average empty space for whole
     week per teacher.
-    :param teachers_empty_space: dictionary where key = name of the teacher, values = list of rows where it is in
+    :param teachers_empty_space: dictionary where key = index of the teacher, values = list of rows where it is in
     :return: total cost, maximum per day, average cost
     """
     # total empty space of all teachers for the whole week
@@ -143,30 +191,27 @@ def hard_constraints_cost(matrix, data):
         for j in range(len(matrix[i])):
             field = matrix[i][j]                                        # for every field in matrix
             if field is not None:
-                c1 = data.classes[field]                                # take class from that field
+                # classes that share teacher or groups with class from that field
+                teachers = data.teacher_conflicts[field]
+                groups = data.group_conflicts[field]
 
                 # calculate loss for classroom
-                if j not in c1.classrooms:
+                if not (data.classroom_masks[field] >> j) & 1:
                     cost_classrooms += 1
                     cost_class[field] += 1
 
                 for k in range(j + 1, len(matrix[i])):                  # go through the end of row
                     next_field = matrix[i][k]
                     if next_field is not None:
-                        c2 = data.classes[next_field]                   # take class of that field
-
                         # calculate loss for teachers
-                        if c1.teacher == c2.teacher:
+                        if next_field in teachers:
                             cost_teacher += 1
                             cost_class[field] += 1
 
                         # calculate loss for groups
-                        g1 = c1.groups
-                        g2 = c2.groups
-                        for g in g1:
-                            if g in g2:
-                                cost_group += 1
-                                cost_class[field] += 1
+                        if next_field in groups:
+                            cost_group += groups[next_field]
+                            cost_class[field] += groups[next_field]
 
     total_cost = cost_teacher + cost_classrooms + cost_group
     return total_cost, cost_class, cost_teacher, cost_classrooms, cost_group
@@ -182,28 +227,23 @@ def check_hard_constraints(matrix, data):
         for j in range(len(matrix[i])):
             field = matrix[i][j]                                    # for every field in matrix
             if field is not None:
-                c1 = data.classes[field]                            # take class from that field
+                # classes that share teacher or groups with class from that field
+                teachers = data.teacher_conflicts[field]
+                groups = data.group_conflicts[field]
 
                 # calculate loss for classroom
-                if j not in c1.classrooms:
+                if not (data.classroom_masks[field] >> j) & 1:
                     overlaps += 1
 
-                for k in range(len(matrix[i])):                     # go through the end of row
+                for k in range(len(matrix[i])):                     # go through the whole row
                     if k != j:
                         next_field = matrix[i][k]
                         if next_field is not None:
-                            c2 = data.classes[next_field]           # take class of that field
-
                             # calculate loss for teachers
-                            if c1.teacher == c2.teacher:
+                            if next_field in teachers:
                                 overlaps += 1
 
                             # calculate loss for groups
-                            g1 = c1.groups
-                            g2 = c2.groups
-                            # print(g1, g2)
-                            for g in g1:
-                                if g in g2:
-                                    overlaps += 1
+                            overlaps += groups.get(next_field, 0)
 
     return overlaps
@@ -0,0 +1,223 @@
+"""
+Population-based genetic algorithm for hard constraints. Timetable (individual) is encoded as a flat array where
+positions 2 * i and 2 * i + 1 hold start row and column of the class with index i, so memory per individual is
+O(number of classes). Every gene is kept valid: class is always in one of its classrooms and does not start one day
+and end on the next, overlaps of classes in the same classroom are counted in fitness.
+"""
+import random
+import time
+from array import array
+from model import FreeFields
+from progress import no_progress
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class Genome:
+    """
+    Properties of classes needed by the genetic algorithm, computed once from data.
+    """
+
+    def __init__(self, data):
+        self.num_of_classes = len(data.classes)
+        self.num_of_columns = len(data.classrooms)
+        self.durations = list(data.durations)
+        self.teachers = list(data.class_teachers)
+        self.groups = [data.classes[i].groups for i in range(self.num_of_classes)]
+        self.columns = [data.classes[i].classrooms for i in range(self.num_of_classes)]
+        # starts: list where index = class index, value = rows in which class can start without ending on the next day
+        self.starts = [[row for row in range(60) if row % 12 + d <= 12] for d in self.durations]
+
+        if np is not None:
+            # every hour of every class: index of the class and offset from its start
+            self.hour_class = np.repeat(np.arange(self.num_of_classes), self.durations)
+            self.hour_offset = np.concatenate([np.arange(d) for d in self.durations])
+            self.hour_teacher = np.array(self.teachers)[self.hour_class]
+            # every hour of every class for each of its groups
+            pairs = [(h, g) for h, c in enumerate(self.hour_class) for g in self.groups[c]]
+            self.group_hour = np.array([h for h, _ in pairs], dtype=np.int64)
+            self.group_index = np.array([g for _, g in pairs], dtype=np.int64)
+            self.num_of_teachers = len(data.teachers)
+            self.num_of_groups = len(data.groups)
+
+    def random_gene(self, index):
+        """
+        Returns random valid (start row, column) for class with given index.
+        """
+        return random.choice(self.starts[index]), random.choice(self.columns[index])
+
+
+def encode(genome, filled):
+    """
+    Encodes timetable given by filled (key = index of the class, value = list of fields in matrix) as individual.
+    """
+    individual = array('h', [0] * (2 * genome.num_of_classes))
+    for index, fields in filled.items():
+        individual[2 * index] = fields[0][0]
+        individual[2 * index + 1] = fields[0][1]
+    return individual
+
+
+def decode(genome, individual):
+    """
+    Decodes individual to filled. Classes that would take an already taken field are moved to the first free block
+    in one of their classrooms, so the result can be written to the matrix.
+    """
+    free = FreeFields(60, genome.num_of_columns)
+    filled = {}
+    moved = []
+    for index in range(genome.num_of_classes):
+        row, column = individual[2 * index], individual[2 * index + 1]
+        fields = [(row + i, column) for i in range(genome.durations[index])]
+        if all(field in free for field in fields):
+            filled[index] = fields
+            for field in fields:
+                free.remove(field)
+        else:
+            moved.append(index)
+    for index in moved:
+        start = free.first_block(genome.durations[index], genome.columns[index])
+        if start is None:
+            raise ValueError('There is no free block for class {}'.format(index))
+        filled[index] = [(start[0] + i, start[1]) for i in range(genome.durations[index])]
+        for field in filled[index]:
+            free.remove(field)
+    return filled
+
+
+def fitness(genome, population):
+    """
+    Calculates cost of hard constraints of all individuals: number of pairs of classes that are in the same row and
+    have the same teacher, group (for each shared group) or classroom. Uses NumPy to evaluate the whole population at
+    once if it is available.
+    :return: list of costs
+    """
+    if np is not None:
+        return _fitness_vectorized(genome, population)
+
+    costs = []
+    for individual in population:
+        counts = {}
+        cost = 0
+        for index in range(genome.num_of_classes):
+            start, column = individual[2 * index], individual[2 * index + 1]
+            for row in range(start, start + genome.durations[index]):
+                keys = [('c', row, column), ('t', row, genome.teachers[index])]
+                keys.extend(('g', row, g) for g in genome.groups[index])
+                for key in keys:
+                    count = counts.get(key, 0)
+                    cost += count
+                    counts[key] = count + 1
+        costs.append(cost)
+    return costs
+
+
+def _fitness_vectorized(genome, population):
+    size = len(population)
+    genes = np.frombuffer(b''.join(individual.tobytes() for individual in population), dtype=np.int16)
+    genes = genes.reshape(size, genome.num_of_classes, 2).astype(np.int64)
+    rows = genes[:, genome.hour_class, 0] + genome.hour_offset
+    columns = genes[:, genome.hour_class, 1]
+    individuals = np.arange(size)[:, None]
+
+    def pairs(keys, num_of_keys):
+        counts = np.bincount((individuals * 60 * num_of_keys + keys).ravel(), minlength=size * 60 * num_of_keys)
+        counts = counts.reshape(size, -1)
+        return (counts * (counts - 1) // 2).sum(axis=1)
+
+    cost = pairs(rows * genome.num_of_columns + columns, genome.num_of_columns)
+    cost += pairs(rows * genome.num_of_teachers + genome.hour_teacher, genome.num_of_teachers)
+    if len(genome.group_hour):
+        cost += pairs(rows[:, genome.group_hour] * genome.num_of_groups + genome.group_index, genome.num_of_groups)
+    return cost.tolist()
+
+
+def crossover(parent1, parent2):
+    """
+    Uniform crossover, child takes (start row, column) of every class from one of the parents.
+    """
+    child = array('h', parent1)
+    for i in range(0, len(child), 2):
+        if random.random() < 0.5:
+            child[i] = parent2[i]
+            child[i + 1] = parent2[i + 1]
+    return child
+
+
+def mutate(genome, individual, rate):
+    """
+    Moves every class with given probability to a random valid place.
+    """
+    for index in range(genome.num_of_classes):
+        if random.random() < rate:
+            individual[2 * index], individual[2 * index + 1] = genome.random_gene(index)
+
+
+def tournament(population, costs, size):
+    best = random.randrange(len(population))
+    for _ in range(size - 1):
+        other = random.randrange(len(population))
+        if costs[other] < costs[best]:
+            best = other
+    return population[best]
+
+
+def genetic_algorithm(data, filled, population_size=50, generations=500, crossover_rate=0.9, mutation_rate=None,
+                      tournament_size=3, elite=2, budget=None, progress=None):
+    """
+    Genetic algorithm that tries to find schedule such that hard constraints are satisfied. Initial population consists
+    of the given timetable and its mutations. Every generation, the best individuals are kept and the rest are made by
+    tournament selection, uniform crossover and mutation. Stops when some individual satisfies all hard constraints.
+    :param filled: initial timetable, dictionary where key = index of the class, value = list of fields in matrix
+    :param mutation_rate: probability of moving each class, by default 1 / number of classes
+    :param budget: if given, algorithm stops when it is exhausted, every individual is one evaluation (Budget)
+    :param progress: callback called with events of the algorithm, see progress.py
+    :return: cost of the best individual and its timetable as filled
+    """
+    if progress is None:
+        progress = no_progress
+    start = time.perf_counter()
+    genome = Genome(data)
+    if mutation_rate is None:
+        mutation_rate = 1 / genome.num_of_classes
+
+    first = encode(genome, filled)
+    population = [first]
+    for _ in range(population_size - 1):
+        individual = array('h', first)
+        mutate(genome, individual, 0.1)
+        population.append(individual)
+    costs = fitness(genome, population)
+    progress({'event': 'phase_start', 'phase': 'genetic', 'elapsed': 0.0, 'cost': min(costs)})
+
+    generation = 0
+    for generation in range(generations):
+        ranked = sorted(range(population_size), key=lambda i: costs[i])
+        progress({'event': 'iteration', 'phase': 'genetic', 'elapsed': time.perf_counter() - start,
+                  'iteration': generation, 'cost': costs[ranked[0]]})
+        if costs[ranked[0]] == 0:
+            break
+        if budget is not None:
+            if budget.exhausted():
+                break
+            budget.spend(population_size)
+
+        children = [population[i] for i in ranked[:elite]]
+        while len(children) < population_size:
+            parent1 = tournament(population, costs, tournament_size)
+            if random.random() < crossover_rate:
+                child = crossover(parent1, tournament(population, costs, tournament_size))
+            else:
+                child = array('h', parent1)
+            mutate(genome, child, mutation_rate)
+            children.append(child)
+        population = children
+        costs = fitness(genome, population)
+
+    best = min(range(population_size), key=lambda i: costs[i])
+    progress({'event': 'phase_end', 'phase': 'genetic', 'elapsed': time.perf_counter() - start,
+              'iteration': generation, 'cost': costs[best]})
+    return costs[best], decode(genome, population[best])
@@ -1,12 +1,30 @@
+import bisect
+import random
+import time
+from array import array
+from costs import SOFT_TERMS, order_violations
+
+
 class Class:
+    """
+    Class to be scheduled. Instances are immutable and have no __dict__: teacher is index of the teacher, groups and
+    classrooms are tuples of indexes of groups and classrooms (columns), duration is number of hours.
+    """
+    __slots__ = ('groups', 'teacher', 'subject', 'type', 'duration', 'classrooms')
 
     def __init__(self, groups, teacher, subject, type, duration, classrooms):
-        self.groups = groups
-        self.teacher = teacher
-        self.subject = subject
-        self.type = type
-        self.duration = duration
-        self.classrooms = classrooms
+        object.__setattr__(self, 'groups', tuple(groups))
+        object.__setattr__(self, 'teacher', teacher)
+        object.__setattr__(self, 'subject', subject)
+        object.__setattr__(self, 'type', type)
+        object.__setattr__(self, 'duration', int(duration))
+        object.__setattr__(self, 'classrooms', tuple(classrooms))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Class is immutable')
+
+    def __reduce__(self):
+        return Class, (self.groups, self.teacher, self.subject, self.type, self.duration, self.classrooms)
 
     def __str__(self):
         return "Groups {} | Teacher '{}' | Subject '{}' | Type {} | {} hours | Classrooms {} \n"\
@@ -17,10 +35,20 @@ class Class:
 
 
 class Classroom:
+    """
+    Classroom, immutable like Class.
+    """
+    __slots__ = ('name', 'type')
 
     def __init__(self, name, type):
-        self.name = name
-        self.type = type
+        object.__setattr__(self, 'name', name)
+        object.__setattr__(self, 'type', type)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Classroom is immutable')
+
+    def __reduce__(self):
+        return Classroom, (self.name, self.type)
 
     def __str__(self):
         return "{} - {} \n".format(self.name, self.type)
@@ -30,9 +58,345 @@ class Classroom:
 
 
 class Data:
+    __slots__ = ('groups', 'teachers', 'classes', 'classrooms', 'teacher_conflicts', 'group_conflicts',
+                 'classroom_masks', 'durations', 'class_teachers')
 
-    def __init__(self, groups, teachers, classes, classrooms):
+    def __init__(self, groups, teachers, classes, classrooms, teacher_conflicts=None, group_conflicts=None,
+                 classroom_masks=None):
         self.groups = groups
         self.teachers = teachers
         self.classes = classes
         self.classrooms = classrooms
+        # teacher_conflicts: dictionary where key = index of a class, value = set of other classes with the same teacher
+        self.teacher_conflicts = teacher_conflicts
+        # group_conflicts: dictionary where key = index of a class, value = dictionary where key = index of other class
+        # that shares at least one group with it, value = number of shared groups
+        self.group_conflicts = group_conflicts
+        # classroom_masks: dictionary where key = index of a class, value = bitmask of allowed classrooms (columns)
+        self.classroom_masks = classroom_masks
+
+        # properties of classes as arrays where index = index of the class: duration and index of the teacher
+        num_of_classes = len(classes)
+        self.durations = array('B', (classes[i].duration for i in range(num_of_classes)))
+        self.class_teachers = array('I', (classes[i].teacher for i in range(num_of_classes)))
+
+
+class FreeFields:
+    """
+    Free fields of timetable matrix, indexed by column. Every column (classroom) keeps a bitset of its rows where bit
+    r is set if field (r, column) is free, so finding a block of consecutive free fields takes a few integer
+    operations per column instead of scanning a list of fields.
+    Supports the same operations as list of (row, column) fields: append, remove, in, len and iteration.
+    """
+
+    def __init__(self, num_of_rows, num_of_columns):
+        self.num_of_rows = num_of_rows
+        self.columns = [(1 << num_of_rows) - 1 for _ in range(num_of_columns)]
+        self.size = num_of_rows * num_of_columns
+        # day_starts: dictionary where key = duration, value = bitset of rows where a class can start without ending
+        # on the next day
+        self.day_starts = {}
+
+    def __contains__(self, field):
+        return (self.columns[field[1]] >> field[0]) & 1 == 1
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for row in range(self.num_of_rows):
+            for column in range(len(self.columns)):
+                if (self.columns[column] >> row) & 1:
+                    yield row, column
+
+    def append(self, field):
+        if field not in self:
+            self.columns[field[1]] |= 1 << field[0]
+            self.size += 1
+
+    def remove(self, field):
+        if field not in self:
+            raise ValueError('Field {} is not free'.format(field))
+        self.columns[field[1]] &= ~(1 << field[0])
+        self.size -= 1
+
+    def _starts_mask(self, duration):
+        if duration not in self.day_starts:
+            mask = 0
+            for row in range(self.num_of_rows):
+                if row % 12 + duration <= 12:
+                    mask |= 1 << row
+            self.day_starts[duration] = mask
+        return self.day_starts[duration]
+
+    def column_starts(self, duration, column):
+        """
+        Returns bitset of rows in which a block of given duration can start in given column, such that the whole
+        block is free and in one day.
+        """
+        free = self.columns[column]
+        starts = free
+        for i in range(1, duration):
+            starts &= free >> i
+        return starts & self._starts_mask(duration)
+
+    def blocks(self, duration, columns):
+        """
+        Returns list of start fields (row, column) of all free blocks of given duration in given columns, sorted by row
+        and then by column.
+        """
+        blocks = []
+        for column in columns:
+            starts = self.column_starts(duration, column)
+            while starts:
+                lowest = starts & -starts
+                blocks.append((lowest.bit_length() - 1, column))
+                starts ^= lowest
+        blocks.sort()
+        return blocks
+
+    def first_block(self, duration, columns):
+        """
+        Returns start field (row, column) of the first free block of given duration in given columns (the lowest row,
+        then the lowest column), or None if there is no such block.
+        """
+        best = None
+        for column in columns:
+            starts = self.column_starts(duration, column)
+            if starts:
+                field = ((starts & -starts).bit_length() - 1, column)
+                if best is None or field < best:
+                    best = field
+        return best
+
+    def random_block(self, duration, columns, prefer=None):
+        """
+        Returns start field (row, column) of a random free block of given duration in given columns, or None if there
+        is no such block.
+        :param prefer: function of start field, if given a random block for which it returns True is taken if there is
+        any
+        """
+        blocks = self.blocks(duration, columns)
+        if not blocks:
+            return None
+        if prefer is None:
+            return random.choice(blocks)
+        random.shuffle(blocks)
+        for start_field in blocks:
+            if prefer(start_field):
+                return start_field
+        return blocks[0]
+
+
+class SubjectsOrder:
+    """
+    Start times of classes of every subject and group, kept sorted separately for each type of class (P, V and L), so
+    that order of types takes into account all classes of a type and not only the last one placed. Number of violated
+    orders (see order_violations) is updated on every insert and remove in O(number of classes of the subject and
+    group), so it is available in O(1).
+    Supports the same read operations as dictionary where key = (name of the subject, index of the group), value =
+    [P start times, V start times, L start times]: [key], in, len, iteration, keys, values, items and update.
+    """
+
+    def __init__(self, keys=()):
+        # times: dictionary where key = (name of the subject, index of the group), value = sorted start times by type
+        self.times = {key: ([], [], []) for key in keys}
+        # orders: dictionary where key = (name of the subject, index of the group), value = (violated, all orders)
+        self.orders = {key: (0, 0) for key in self.times}
+        self.violated = 0
+        self.total = 0
+
+    def __getitem__(self, key):
+        return self.times[key]
+
+    def __contains__(self, key):
+        return key in self.times
+
+    def __len__(self):
+        return len(self.times)
+
+    def __iter__(self):
+        return iter(self.times)
+
+    def keys(self):
+        return self.times.keys()
+
+    def values(self):
+        return self.times.values()
+
+    def items(self):
+        return self.times.items()
+
+    def update(self, other):
+        """
+        Adds start times and orders of all subjects and groups of other SubjectsOrder.
+        """
+        for key, times in other.items():
+            if key in self.times:
+                self.violated -= self.orders[key][0]
+                self.total -= self.orders[key][1]
+            self.times[key] = tuple(list(t) for t in times)
+            self.orders[key] = (0, 0)
+            self._update(key)
+
+    @staticmethod
+    def _type_index(type):
+        if type == 'P':
+            return 0
+        elif type == 'V':
+            return 1
+        return 2
+
+    def insert(self, key, type, start_time):
+        """
+        Adds start time of a class of given type for given (subject, group).
+        """
+        bisect.insort(self.times[key][self._type_index(type)], start_time)
+        self._update(key)
+
+    def remove(self, key, type, start_time):
+        """
+        Removes start time of a class of given type for given (subject, group).
+        """
+        times = self.times[key][self._type_index(type)]
+        del times[bisect.bisect_left(times, start_time)]
+        self._update(key)
+
+    def _update(self, key):
+        new = order_violations(self.times[key])
+        old = self.orders[key]
+        self.violated += new[0] - old[0]
+        self.total += new[1] - old[1]
+        self.orders[key] = new
+
+
+class Config:
+    """
+    Parameters of the algorithm.
+    """
+
+    def __init__(self, seed=None, backend='python', method='es', initial='constructive', moves='all', n=3, sigma=2,
+                 run_times=5, max_stagnation=200, iter_count=2500, temperature=0.5, cooling=0.99, schedule='adaptive',
+                 step='single', weights=None, target_acceptance=0.1, final_acceptance=0.01, window=50, reheat_after=300,
+                 max_reheats=2, population_size=50, generations=500, crossover_rate=0.9, mutation_rate=None,
+                 tournament_size=3, elite=2, time_limit=None, max_evaluations=None, profile=False):
+        # seed for random number generator, runs with the same seed and data give the same timetable
+        self.seed = seed
+        # 'python' or 'numpy' (array-backed timetable with vectorized costs) for simulated hardening, 'numpy' only
+        # with batch steps
+        if backend == 'numpy' and step == 'single':
+            raise ValueError("Backend 'numpy' requires step 'batch', single steps use only incremental costs")
+        self.backend = backend
+        # 'es' - (1+1) evolutionary strategy, 'ga' - genetic algorithm followed by (1+1) evolutionary strategy
+        self.method = method
+        # initial timetable: 'constructive' (see constructive_population) or 'first' (see initial_population)
+        self.initial = initial
+        # moves of evolutionary algorithm: 'ideal' - first spot without overlaps, 'all' - also other moves (see
+        # evolutionary_algorithm)
+        self.moves = moves
+        # evolutionary algorithm: Stifel's n, initial sigma, number of runs and maximum iterations without improvement
+        self.n = n
+        self.sigma = sigma
+        self.run_times = run_times
+        self.max_stagnation = max_stagnation
+        # simulated hardening: number of iterations, initial temperature and its decrease factor
+        self.iter_count = iter_count
+        self.temperature = temperature
+        self.cooling = cooling
+        # simulated hardening: 'geometric' - temperature and cooling above, 'adaptive' - initial temperature is
+        # calibrated so that target_acceptance of sampled moves that increase the cost would be accepted, and every
+        # window of iterations cooling is sped up or paused so that acceptance of such moves follows a target that
+        # decreases from target_acceptance to final_acceptance; when acceptance falls under final_acceptance and the
+        # best cost did not improve for reheat_after iterations, temperature is raised again (at most max_reheats
+        # times) or the algorithm stops
+        self.schedule = schedule
+        # simulated hardening: 'batch' - every iteration moves 1/4 of the classes and accepts or rejects them together,
+        # 'single' - every iteration makes that many steps, each moves one class and is accepted or rejected alone
+        self.step = step
+        # simulated hardening: weights of terms of the soft constraints cost (see soft_cost_terms), dictionary where
+        # key = term, value = its weight; given weights override the default ones
+        self.weights = {'groups': 1, 'teachers': 1, 'max_gap': 0, 'order': 1, 'free_hour': 1}
+        for term, weight in (weights or {}).items():
+            if term not in SOFT_TERMS:
+                raise ValueError('Unknown term of soft constraints cost: {}'.format(term))
+            self.weights[term] = weight
+        if not 0 < final_acceptance < target_acceptance < 1:
+            raise ValueError('Acceptance rates must satisfy 0 < final_acceptance < target_acceptance < 1, got {} and {}'
+                             .format(final_acceptance, target_acceptance))
+        if window < 1:
+            raise ValueError('Window must be at least 1 iteration, got {}'.format(window))
+        self.target_acceptance = target_acceptance
+        self.final_acceptance = final_acceptance
+        self.window = window
+        self.reheat_after = reheat_after
+        self.max_reheats = max_reheats
+        # genetic algorithm: number of individuals, maximum number of generations, probability of crossover,
+        # probability of moving each class (by default 1 / number of classes), size of tournaments and number of the
+        # best individuals kept in every generation
+        self.population_size = population_size
+        self.generations = generations
+        self.crossover_rate = crossover_rate
+        self.mutation_rate = mutation_rate
+        self.tournament_size = tournament_size
+        self.elite = elite
+        # time limit for the whole algorithm in seconds and maximum number of cost evaluations (see Budget)
+        self.time_limit = time_limit
+        self.max_evaluations = max_evaluations
+        # collect profiling statistics (Result.stats)
+        self.profile = profile
+
+    def __repr__(self):
+        return 'Config({})'.format(', '.join('{}={!r}'.format(k, v) for k, v in self.__dict__.items()))
+
+
+class Result:
+    """
+    Timetable found by the algorithm with its helper structures and statistics.
+    """
+
+    def __init__(self, matrix, filled, groups_empty_space, teachers_empty_space, subjects_order, statistics,
+                 stop_reason=None, stats=None):
+        self.matrix = matrix
+        self.filled = filled
+        self.groups_empty_space = groups_empty_space
+        self.teachers_empty_space = teachers_empty_space
+        self.subjects_order = subjects_order
+        # statistics: dictionary returned by get_statistics
+        self.statistics = statistics
+        # why the algorithm stopped before its end: 'interrupt', 'time', 'evaluations' or None if it finished
+        self.stop_reason = stop_reason
+        # stats: profiling.Stats if profiling was enabled in Config, otherwise None
+        self.stats = stats
+
+
+class Budget:
+    """
+    Limits time and number of cost evaluations of the algorithm, shared by all of its phases. Evaluation is one
+    computation of the cost of the timetable (one iteration of evolutionary algorithm, one step of simulated hardening
+    or one individual of genetic algorithm).
+    Algorithm also stops when interrupted is set (e.g. on SIGINT).
+    """
+
+    def __init__(self, time_limit=None, max_evaluations=None):
+        self.deadline = time.time() + time_limit if time_limit is not None else None
+        self.max_evaluations = max_evaluations
+        self.evaluations = 0
+        self.interrupted = False
+
+    def spend(self, evaluations=1):
+        self.evaluations += evaluations
+
+    def stop_reason(self):
+        """
+        Returns why the budget is exhausted ('interrupt', 'time' or 'evaluations'), or None if it is not.
+        """
+        if self.interrupted:
+            return 'interrupt'
+        if self.deadline is not None and time.time() >= self.deadline:
+            return 'time'
+        if self.max_evaluations is not None and self.evaluations >= self.max_evaluations:
+            return 'evaluations'
+        return None
+
+    def exhausted(self):
+        return self.stop_reason() is not None
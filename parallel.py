@@ -0,0 +1,292 @@
+"""
+Runs more independent runs of the algorithm on the same data in parallel processes and selects the best timetable.
+"""
+import argparse
+import copy
+import multiprocessing
+import os
+import random
+import signal
+import time
+from costs import hard_constraints_cost
+from model import Budget, Config
+from progress import no_progress
+from scheduler import solve, place_classes, evolutionary_algorithm, restore_timetable
+from utils import load_data, write_solution_to_file
+
+# data shared by all runs in one worker process, it is sent to each process only once
+_data = None
+
+
+def default_objective(statistics):
+    """
+    Key by which the best timetable is selected (lower is better): satisfied hard constraints, then existence of free
+    hour and then the lowest average empty space for groups and teachers.
+    """
+    return statistics['hard_cost'], statistics['free_hour'] == -1, \
+        statistics['groups_average'] + statistics['teachers_average']
+
+
+def _init_worker(data):
+    global _data
+    _data = data
+
+
+def _with_seed(config, seed):
+    config = copy.copy(config)
+    config.seed = seed
+    return config
+
+
+def _run(config):
+    result = solve(_data, config)
+    return config.seed, result.statistics, result.filled, result.subjects_order
+
+
+def run_parallel(data, runs=10, processes=None, config=None, objective=default_objective):
+    """
+    Runs the algorithm given number of times with seeds seed, seed + 1, ... (seed from config, 0 if not given) in a
+    pool of processes.
+    :param data: loaded input data, shared by all runs
+    :param processes: number of processes, by default number of CPUs
+    :param config: parameters of the algorithm (Config)
+    :param objective: function that maps statistics of a run (see get_statistics) to a key, the lowest key is the best
+    :return: list of (seed, statistics, filled, subjects_order) for every run, sorted from the best
+    """
+    if config is None:
+        config = Config()
+    seed = config.seed or 0
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(data,)) as pool:
+        results = pool.map(_run, [_with_seed(config, seed + i) for i in range(runs)])
+    return sorted(results, key=lambda result: objective(result[1]))
+
+
+def _init_island_worker(data):
+    _init_worker(data)
+    # islands are stopped by the main process between migrations
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _evolve(args):
+    filled, seed, config, iterations, deadline, max_evaluations = args
+    random.seed(seed)
+    matrix, free, filled, groups_empty_space, teachers_empty_space, subjects_order = place_classes(_data, filled)
+    budget = Budget(max_evaluations=max_evaluations)
+    budget.deadline = deadline
+    # end: event at the end of the evolutionary algorithm, with number of its iterations and moves
+    end = {}
+
+    def progress(event):
+        if event['event'] == 'phase_end':
+            end.update(event)
+    cost = evolutionary_algorithm(matrix, _data, free, filled, groups_empty_space, teachers_empty_space,
+                                  subjects_order, config, max_iterations=iterations, budget=budget, progress=progress)
+    return cost, filled, end['iteration'], end['moves']
+
+
+def migrate(islands, topology):
+    """
+    Sends timetables between islands, island takes the received timetable if it has lower cost than its own.
+    :param islands: list of (cost, filled) for every island
+    :param topology: 'ring' - every island receives timetable from the previous one, 'all' - every island receives
+    the best timetable of all islands
+    :return: list of (cost, filled) after migration
+    """
+    if topology == 'ring':
+        migrants = [islands[i - 1] for i in range(len(islands))]
+    elif topology == 'all':
+        migrants = [min(islands, key=lambda island: island[0])] * len(islands)
+    else:
+        raise ValueError('Unknown topology {}'.format(topology))
+    return [migrant if migrant[0] < island[0] else island for island, migrant in zip(islands, migrants)]
+
+
+def island_evolutionary_algorithm(data, filled, islands=4, interval=50, topology='ring', max_epochs=100,
+                                  processes=None, seed=0, config=None, budget=None, progress=None):
+    """
+    Island model of evolutionary algorithm: every island evolves its own timetable in separate process and after every
+    interval iterations the islands exchange their timetables (see migrate). Stops when some island satisfies all hard
+    constraints, after max_epochs intervals or when budget is exhausted (it is checked between intervals, and islands
+    share its remaining evaluations).
+    :param filled: initial timetable of all islands, dictionary where key = index of the class, value = list of fields
+    :param config: parameters of the algorithm (Config), evolutionary algorithm of islands uses n, sigma and moves
+    :param budget: if given, algorithm stops when it is exhausted, every iteration of every island is one evaluation
+    :param progress: callback called with start and end of the phase, see progress.py
+    :return: cost of hard constraints and filled of the best island, cost is None if no interval was run
+    """
+    if config is None:
+        config = Config()
+    if progress is None:
+        progress = no_progress
+    start = time.perf_counter()
+    progress({'event': 'phase_start', 'phase': 'evolutionary', 'elapsed': 0.0})
+    population = [(None, filled)] * islands
+    iterations = moves = 0
+    with multiprocessing.Pool(processes, initializer=_init_island_worker, initargs=(data,)) as pool:
+        for epoch in range(max_epochs):
+            if budget is not None and budget.exhausted():
+                break
+            deadline = budget.deadline if budget is not None else None
+            max_evaluations = None
+            if budget is not None and budget.max_evaluations is not None:
+                max_evaluations = max(1, (budget.max_evaluations - budget.evaluations) // islands)
+            results = pool.map(_evolve, [(island[1], seed + epoch * islands + i, config, interval, deadline,
+                                          max_evaluations) for i, island in enumerate(population)])
+            population = [(cost, island_filled) for cost, island_filled, _, _ in results]
+            iterations += sum(result[2] for result in results)
+            moves += sum(result[3] for result in results)
+            if budget is not None:
+                budget.spend(sum(result[2] for result in results))
+            if min(cost for cost, _ in population) == 0:
+                break
+            population = migrate(population, topology)
+
+    best = population[0] if population[0][0] is None else min(population, key=lambda island: island[0])
+    progress({'event': 'phase_end', 'phase': 'evolutionary', 'elapsed': time.perf_counter() - start,
+              'iteration': iterations, 'cost': best[0], 'moves': moves})
+    return best
+
+
+def island_model(islands=4, interval=50, topology='ring', max_epochs=100, processes=None):
+    """
+    Returns function that can be given to solve instead of evolutionary_algorithm (see its evolve parameter). It runs
+    island_evolutionary_algorithm and moves the classes to the timetable of the best island. When only some classes
+    can be moved (warm start), single evolutionary_algorithm is used, because islands move all classes.
+    """
+    def island_evolution(matrix, data, free, filled, groups_empty_space, teachers_empty_space, subjects_order,
+                         config, budget=None, progress=None, stats=None, movable=None):
+        if movable is not None:
+            return evolutionary_algorithm(matrix, data, free, filled, groups_empty_space, teachers_empty_space,
+                                          subjects_order, config, budget=budget, progress=progress, stats=stats,
+                                          movable=movable)
+        _, best = island_evolutionary_algorithm(data, filled, islands, interval, topology, max_epochs, processes,
+                                                config.seed or 0, config, budget, progress)
+        restore_timetable(best, matrix, data, free, filled, groups_empty_space, teachers_empty_space, subjects_order)
+        return hard_constraints_cost(matrix, data)[0]
+    return island_evolution
+
+
+def run_islands(data, config=None, progress=None, **island_options):
+    """
+    Runs the algorithm (see solve) with island model of evolutionary algorithm (see island_model) instead of single
+    (1+1) evolutionary strategy.
+    :param config: parameters of the algorithm (Config)
+    :param progress: callback called with events of all phases, see progress.py
+    :return: Result
+    """
+    return solve(data, config, progress, evolve=island_model(**island_options))
+
+
+def average_table(runs_statistics):
+    """
+    Returns table with statistics averaged over all runs for every input (Table 1 in README).
+    :param runs_statistics: dictionary where key = name of the input, value = list of statistics of its runs
+    """
+    rows = [
+        ('Fulfillment of hard constraints', lambda s: 100 * (s['hard_cost'] == 0), '{:.0f}%'),
+        ('Fulfillment of soft constraints', lambda s: s['soft_satisfied'], '{:.02f}%'),
+        ('Average idle for groups <br />(all days together)', lambda s: s['groups_average'], '{:.02f}'),
+        ('Average idle for teachers <br />(all days together)', lambda s: s['teachers_average'], '{:.02f}'),
+        ('Existance of free hour', lambda s: 100 * (s['free_hour'] != -1), '{:.0f}%'),
+    ]
+    averages = []
+    for title, value, form in rows:
+        averages.append((title, [form.format(sum(value(s) for s in statistics) / len(statistics))
+                                 for statistics in runs_statistics.values()]))
+    return _table(runs_statistics, averages)
+
+
+def best_table(best_statistics):
+    """
+    Returns table with detailed statistics of the best timetable for every input (Table 2 in README).
+    :param best_statistics: dictionary where key = name of the input, value = statistics of its best run
+    """
+    rows = [
+        ('Fulfillment of hard constraints',
+         lambda s: '100%' if s['hard_cost'] == 0 else 'cost {}'.format(s['hard_cost'])),
+        ('Fulfillment of soft constraints', lambda s: '{:.02f}%'.format(s['soft_satisfied'])),
+        ('Maximum idle for groups <br />(in one day)', lambda s: s['groups_max']),
+        ('Total idle for groups <br />(all days together)', lambda s: s['groups_total']),
+        ('Average idle for groups <br />(all days together)', lambda s: '{:.02f}'.format(s['groups_average'])),
+        ('Maximum idle for teachers <br />(in one day)', lambda s: s['teachers_max']),
+        ('Total idle for teachers <br />(all days together)', lambda s: s['teachers_total']),
+        ('Average idle for teachers <br />(all days together)', lambda s: '{:.02f}'.format(s['teachers_average'])),
+        ('Free hour', lambda s: 'none' if s['free_hour'] == -1 else s['free_hour']),
+    ]
+    return _table(best_statistics, [(title, [value(s) for s in best_statistics.values()]) for title, value in rows])
+
+
+def _table(columns, rows):
+    lines = ['|               | ' + ' | '.join('*{}*'.format(name) for name in columns) + ' |',
+             '| ------------- | ' + ' | '.join('-------------' for _ in columns) + ' |']
+    for title, values in rows:
+        lines.append('| {} | '.format(title) + ' | '.join(str(value) for value in values) + ' |')
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs the algorithm more times in parallel and selects the best '
+                                                 'timetable for every input file.')
+    parser.add_argument('files', nargs='+', help='paths to input files')
+    parser.add_argument('--runs', type=int, default=10, help='number of runs for every input')
+    parser.add_argument('--processes', type=int, default=None, help='number of processes, by default number of CPUs')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first run')
+    parser.add_argument('--time-limit', type=float, default=None, help='time limit for every run in seconds')
+    parser.add_argument('--backend', choices=['python', 'numpy'], default='python',
+                        help='numpy - array-backed timetable with vectorized costs for simulated hardening, only with '
+                             '--step batch')
+    parser.add_argument('--step', choices=['batch', 'single'], default='single',
+                        help='simulated hardening: batch - accept or reject moves of 1/4 of classes together, single - '
+                             'accept or reject every move of one class by its own change of the cost')
+    parser.add_argument('--method', choices=['es', 'ga'], default='es',
+                        help='es - (1+1) evolutionary strategy, ga - genetic algorithm for hard constraints')
+    parser.add_argument('--islands', type=int, default=0,
+                        help='number of islands of evolutionary algorithm, if given runs are executed one by one and '
+                             'islands of each run in parallel')
+    parser.add_argument('--migration-interval', type=int, default=50,
+                        help='number of iterations between migrations of islands')
+    parser.add_argument('--cache-dir', help='directory where compiled input data is cached')
+    parser.add_argument('--output-dir', default='solution_files', help='directory for the best solution of every input')
+    parser.add_argument('--topology', choices=['ring', 'all'], default='ring', help='migration topology of islands')
+    args = parser.parse_args()
+    if args.backend == 'numpy' and args.step == 'single':
+        parser.error('--backend numpy requires --step batch')
+    config = Config(seed=args.seed, backend=args.backend, method=args.method, step=args.step,
+                    time_limit=args.time_limit)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    runs_statistics = {}
+    best_statistics = {}
+    # all inputs are loaded first, so that an invalid one is reported before any runs
+    inputs = []
+    for path in args.files:
+        try:
+            inputs.append((os.path.basename(path), load_data(path, {}, {}, {}, seed=args.seed,
+                                                             cache_dir=args.cache_dir)))
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    for name, data in inputs:
+        if args.islands:
+            results = []
+            for seed in range(args.seed, args.seed + args.runs):
+                result = run_islands(data, _with_seed(config, seed), islands=args.islands,
+                                     interval=args.migration_interval, topology=args.topology,
+                                     processes=args.processes)
+                results.append((seed, result.statistics, result.filled, result.subjects_order))
+            results.sort(key=lambda result: default_objective(result[1]))
+        else:
+            results = run_parallel(data, args.runs, args.processes, config)
+        runs_statistics[name] = [statistics for _, statistics, _, _ in results]
+        seed, best_statistics[name], filled, subjects_order = results[0]
+
+        matrix, _, _, groups_empty_space, teachers_empty_space, _ = place_classes(data, filled)
+        write_solution_to_file(matrix, data, filled, os.path.join(args.output_dir, 'sol_' + name), groups_empty_space,
+                               teachers_empty_space, subjects_order)
+        print('{}: best run has seed {}'.format(name, seed))
+
+    print('\n' + average_table(runs_statistics) + '\n')
+    print(best_table(best_statistics))
+
+
+if __name__ == '__main__':
+    main()
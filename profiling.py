@@ -0,0 +1,88 @@
+"""
+Instrumentation of the algorithm. When Stats object is given to the algorithm, calls of the functions on its hot path
+are counted and timed, placement search records why free places of classes it checked were rejected and, separately,
+how many start fields were never candidates, and simulated hardening records accepted and rejected moves per
+temperature. Without it, the algorithm runs uninstrumented.
+"""
+import json
+import time
+
+
+class Stats:
+    """
+    Collected statistics of one run of the algorithm.
+    """
+
+    def __init__(self):
+        # calls: dictionary where key = name of the function, value = number of calls
+        self.calls = {}
+        # times: dictionary where key = name of the function, value = cumulative time of calls in seconds
+        self.times = {}
+        # rejections: dictionary where key = reason, value = number of free blocks of classes rejected by a check
+        self.rejections = {}
+        # excluded: dictionary where key = reason, value = number of start fields of classes that were not candidates
+        # at all, because free blocks are enumerated only in suitable classrooms, inside one day and on free fields
+        self.excluded = {}
+        # temperatures: dictionary where key = temperature rounded to 2 significant digits, value = [accepted, rejected]
+        self.temperatures = {}
+
+    def profile(self, function, name=None):
+        """
+        Returns function that calls the given one and records the call and its duration under its name.
+        """
+        if name is None:
+            name = function.__name__
+
+        def profiled(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.times[name] = self.times.get(name, 0.0) + time.perf_counter() - start
+                self.calls[name] = self.calls.get(name, 0) + 1
+        return profiled
+
+    def reject(self, reason, count=1):
+        if count:
+            self.rejections[reason] = self.rejections.get(reason, 0) + count
+
+    def exclude(self, reason, count):
+        if count:
+            self.excluded[reason] = self.excluded.get(reason, 0) + count
+
+    def record_move(self, temperature, accepted):
+        moves = self.temperatures.setdefault('{:.2g}'.format(temperature), [0, 0])
+        moves[0 if accepted else 1] += 1
+
+    def to_dict(self):
+        return {
+            'calls': self.calls,
+            'times': self.times,
+            'rejections': self.rejections,
+            'excluded': self.excluded,
+            'temperatures': {t: {'accepted': a, 'rejected': r} for t, (a, r) in self.temperatures.items()},
+        }
+
+    def write(self, file_path):
+        """
+        Writes statistics as JSON to the given file.
+        """
+        with open(file_path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+    def summary(self):
+        """
+        Returns statistics as text table, functions are sorted by cumulative time.
+        """
+        lines = ['{:28s} {:>10s} {:>12s}'.format('function', 'calls', 'time [s]')]
+        for name in sorted(self.times, key=self.times.get, reverse=True):
+            lines.append('{:28s} {:10d} {:12.4f}'.format(name, self.calls[name], self.times[name]))
+        lines.append('')
+        lines.append('{:28s} {:>10s}'.format('rejection reason', 'count'))
+        for reason in sorted(self.rejections, key=self.rejections.get, reverse=True):
+            lines.append('{:28s} {:10d}'.format(reason, self.rejections[reason]))
+        lines.append('')
+        lines.append('{:28s} {:>10s}'.format('not a candidate', 'count'))
+        for reason in sorted(self.excluded, key=self.excluded.get, reverse=True):
+            lines.append('{:28s} {:10d}'.format(reason, self.excluded[reason]))
+        return '\n'.join(lines)
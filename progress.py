@@ -0,0 +1,107 @@
+"""
+Progress reporting of the algorithm. Algorithms call progress(event) with a dictionary that describes the event, so
+the caller decides what happens with it: nothing (no_progress, the default), printing (PrintProgress) or writing one
+JSON object per line (JsonLinesProgress).
+
+Every event has keys:
+    event: 'phase_start', 'iteration', 'run_end' (one run of evolutionary algorithm), 'phase_end' or 'finish'
+    phase: 'initial', 'genetic', 'evolutionary', 'hardening' or 'solve' (for 'finish')
+    elapsed: seconds since the start of the phase
+Events 'iteration', 'run_end' and 'phase_end' also have 'iteration' and 'cost', and depending on the phase:
+    genetic: nothing more, cost is the cost of the best individual
+    evolutionary: run, sigma, teachers_cost, groups_cost, classrooms_cost and acceptance_rate (share of iterations of
+    the run that decreased the cost), 'phase_end' has only moves (number of attempted moves of classes)
+    hardening: best_cost, temperature and acceptance_rate (share of accepted steps so far), 'phase_end' also
+    reheats (number of reheats of the adaptive schedule), steps (number of accepted or rejected steps), accepted and
+    terms (unweighted terms of the soft constraints cost, see soft_cost_terms)
+Event 'phase_end' of the initial phase has affected (number of classes that could not keep their place) on warm start
+and unplaced (indexes of classes that could not be placed without overlaps) with constructive initial timetable.
+Event 'finish' has stop_reason (see Budget.stop_reason).
+"""
+import json
+import sys
+
+
+def no_progress(event):
+    """
+    Progress callback that ignores all events.
+    """
+    pass
+
+
+class PrintProgress:
+    """
+    Prints progress in human readable form: costs at the end of phases and runs, and every interval-th iteration of
+    simulated hardening.
+    """
+
+    def __init__(self, file=None, interval=100):
+        """
+        :param file: stream to print to, by default standard output
+        :param interval: simulated hardening iterations are printed when iteration is divisible by it
+        """
+        self.file = file
+        self.interval = interval
+
+    def __call__(self, event):
+        kind = event['event']
+        phase = event['phase']
+        if kind == 'phase_end' and phase == 'initial':
+            self._print('Initial cost of hard constraints: {}'.format(event['cost']))
+            if event.get('unplaced'):
+                self._print('Classes that could not be placed without overlaps: {}'.format(
+                    ', '.join(str(index) for index in event['unplaced'])))
+        elif kind == 'phase_end' and phase == 'genetic':
+            self._print('Genetic algorithm | generations: {} | cost: {}'.format(event['iteration'], event['cost']))
+        elif kind == 'run_end':
+            self._print('Run {} | sigma = {:.4f} | number of iterations: {} \nCost: {} \nTeachers cost: {} | '
+                        'Groups cost: {} | Classrooms cost: {}'.format(event['run'], event['sigma'],
+                                                                      event['iteration'], event['cost'],
+                                                                      event['teachers_cost'], event['groups_cost'],
+                                                                      event['classrooms_cost']))
+        elif kind == 'iteration' and phase == 'hardening' and event['iteration'] % self.interval == 0:
+            self._print('Iteration: {:4d} | Average cost: {:0.8f} | Temperature: {:0.6f} | Acceptance rate: '
+                        '{:0.2f}'.format(event['iteration'], event['cost'], event['temperature'],
+                                         event['acceptance_rate']))
+        elif kind == 'phase_end' and phase in ('evolutionary', 'hardening'):
+            self._print('End of {} phase | cost: {} | time: {:.2f} s'.format(phase, event['cost'], event['elapsed']))
+            if 'terms' in event:
+                self._print(' | '.join('{}: {:.4g}'.format(term, value) for term, value in event['terms'].items()))
+        elif kind == 'finish' and event['stop_reason'] is not None:
+            self._print('Stopped early ({}), the best timetable found is kept.'.format(event['stop_reason']))
+
+    def _print(self, text):
+        print(text, file=self.file or sys.stdout)
+
+
+class JsonLinesProgress:
+    """
+    Writes every event as one line of JSON to the given file, which can be a path or an open stream. Iteration events
+    are written only when iteration is divisible by interval.
+    """
+
+    def __init__(self, file, interval=1):
+        if isinstance(file, str):
+            self.file = open(file, 'w')
+            self.own_file = True
+        else:
+            self.file = file
+            self.own_file = False
+        self.interval = interval
+
+    def __call__(self, event):
+        if event['event'] == 'iteration' and event['iteration'] % self.interval != 0:
+            return
+        self.file.write(json.dumps(event) + '\n')
+
+    def close(self):
+        if self.own_file:
+            self.file.close()
+        else:
+            self.file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,9 +1,21 @@
+import argparse
+import heapq
+import itertools
+import os
 import random
+import signal
+import threading
+import time
 from operator import itemgetter
-from utils import load_data, show_timetable, set_up, show_statistics, write_solution_to_file
-from costs import check_hard_constraints, hard_constraints_cost, empty_space_groups_cost, empty_space_teachers_cost, \
-    free_hour
-import copy
+from utils import load_data, show_timetable, set_up, show_statistics, write_solution_to_file, set_up_structures, \
+    get_statistics, read_solution, write_solution_jsonl
+from costs import check_hard_constraints, hard_constraints_cost, weighted_soft_cost, SOFT_TERMS
+from trackers import HardConstraintsTracker, MoveJournal, SoftConstraintsTracker
+from vectorized import ArrayTimetable
+from genetic import genetic_algorithm
+from model import Config, Result, Budget
+from progress import no_progress, PrintProgress, JsonLinesProgress
+from profiling import Stats
 import math
 
 
@@ -15,46 +27,24 @@ def initial_population(data, matrix, free, filled, groups_empty_space, teachers_
     classes = data.classes
 
     for index, classs in classes.items():
-        ind = 0
-        # ind = random.randrange(len(free) - int(classs.duration))
-        while True:
-            start_field = free[ind]
-
-            # check if class won't start one day and end on the next
-            start_time = start_field[0]
-            end_time = start_time + int(classs.duration) - 1
-            if start_time % 12 > end_time % 12:
-                ind += 1
-                continue
-
-            found = True
-            # check if whole block for the class is free
-            for i in range(1, int(classs.duration)):
-                field = (i + start_time, start_field[1])
-                if field not in free:
-                    found = False
-                    ind += 1
-                    break
+        # first block of free fields in fitting classroom such that class won't start one day and end on the next
+        start_field = free.first_block(classs.duration, classs.classrooms)
+        if start_field is None:
+            raise ValueError('There is no free block for class {}'.format(index))
+        start_time = start_field[0]
 
-            # secure that classroom fits
-            if start_field[1] not in classs.classrooms:
-                ind += 1
-                continue
+        for group_index in classs.groups:
+            # add order of the subjects for group
+            insert_order(subjects_order, classs.subject, group_index, classs.type, start_time)
+            # add times of the class for group
+            for i in range(classs.duration):
+                groups_empty_space[group_index].append(i + start_time)
 
-            if found:
-                for group_index in classs.groups:
-                    # add order of the subjects for group
-                    insert_order(subjects_order, classs.subject, group_index, classs.type, start_time)
-                    # add times of the class for group
-                    for i in range(int(classs.duration)):
-                        groups_empty_space[group_index].append(i + start_time)
-
-                for i in range(int(classs.duration)):
-                    filled.setdefault(index, []).append((i + start_time, start_field[1]))        # add to filled
-                    free.remove((i + start_time, start_field[1]))                                # remove from free
-                    # add times of the class for teachers
-                    teachers_empty_space[classs.teacher].append(i + start_time)
-                break
+        for i in range(classs.duration):
+            filled.setdefault(index, []).append((i + start_time, start_field[1]))        # add to filled
+            free.remove((i + start_time, start_field[1]))                                # remove from free
+            # add times of the class for teachers
+            teachers_empty_space[classs.teacher].append(i + start_time)
 
     # fill the matrix
     for index, fields_list in filled.items():
@@ -62,177 +52,571 @@ def initial_population(data, matrix, free, filled, groups_empty_space, teachers_
             matrix[field[0]][field[1]] = index
 
 
-def insert_order(subjects_order, subject, group, type, start_time):
+def constructive_population(data, matrix, free, filled, groups_empty_space, teachers_empty_space, subjects_order):
     """
-    Inserts start time of the class for given subject, group and type of class.
+    Sets up initial timetable with greedy constructive heuristic similar to DSATUR graph colouring. Classes are placed
+    one by one and the next one is the class with the most rows taken by already placed classes it can not overlap
+    with (same teacher or group), ties are broken by difficulty: fewer fitting classrooms, longer duration and more
+    classes it can overlap with. Every class is inserted into a free block of its classrooms without overlaps if there
+    is one, otherwise into the first free block. Out of blocks without overlaps, blocks next to taken fields or the
+    start or end of a day are preferred (random one of them), so that free fields stay together for longer classes.
+    :return: list of indexes of classes that could not be placed without overlaps
     """
-    times = subjects_order[(subject, group)]
-    if type == 'P':
-        times[0] = start_time
-    elif type == 'V':
-        times[1] = start_time
-    else:
-        times[2] = start_time
-    subjects_order[(subject, group)] = times
+    classes = data.classes
+    # blocked: dictionary where key = index of a class, value = rows taken by classes it can not overlap with
+    blocked = {index: set() for index in classes}
+    degree = {index: len(data.teacher_conflicts[index]) + len(data.group_conflicts[index]) for index in classes}
 
+    def priority(index):
+        classs = classes[index]
+        return -len(blocked[index]), len(classs.classrooms), -classs.duration, -degree[index], index
+
+    # heap may contain old priorities of a class, only the entry with its current priority is used
+    heap = [priority(index) for index in classes]
+    heapq.heapify(heap)
+    placed = set()
+    unplaced = []
+    while heap:
+        key = heapq.heappop(heap)
+        index = key[-1]
+        if index in placed or key[0] != -len(blocked[index]):
+            continue
 
-def exchange_two(matrix, filled, ind1, ind2):
+        classs = classes[index]
+        duration = classs.duration
+        rows_blocked = blocked[index]
+        candidates = [start for start in free.blocks(duration, classs.classrooms)
+                      if not any(row in rows_blocked for row in range(start[0], start[0] + duration))]
+        if candidates:
+            fits = [_fit(matrix, start, duration) for start in candidates]
+            best = max(fits)
+            start_field = random.choice([start for start, fit in zip(candidates, fits) if fit == best])
+        else:
+            unplaced.append(index)
+            start_field = free.first_block(duration, classs.classrooms)
+            if start_field is None:
+                raise ValueError('There is no free block for class {}'.format(index))
+        fields = [(start_field[0] + i, start_field[1]) for i in range(duration)]
+        insert_class(matrix, data, index, fields, free, filled, groups_empty_space, teachers_empty_space,
+                     subjects_order)
+        placed.add(index)
+
+        rows = range(start_field[0], start_field[0] + duration)
+        for other in itertools.chain(data.teacher_conflicts[index], data.group_conflicts[index]):
+            if other not in placed:
+                blocked[other].update(rows)
+                heapq.heappush(heap, priority(other))
+    return unplaced
+
+
+def _fit(matrix, start_field, duration):
+    """
+    Returns how many ends of the block (0, 1 or 2) touch a taken field or the start or end of a day.
     """
-    Changes places of two classes with the same duration in timetable matrix.
+    row, column = start_field
+    before = row % 12 == 0 or matrix[row - 1][column] is not None
+    end = row + duration
+    after = end % 12 == 0 or matrix[end][column] is not None
+    return before + after
+
+
+def place_previous(data, placements, matrix, free, filled, groups_empty_space, teachers_empty_space, subjects_order):
+    """
+    Sets up initial timetable from placements of classes in previous solution (see read_solution_file), e.g. before
+    the input changed. Placement is kept if its class still exists (same subject, type, teacher, groups and duration),
+    its classroom fits the class and it has no overlaps with already kept placements. Other classes are affected and
+    are inserted into the first free block without teacher and group overlaps, or into the first free block if there
+    is no such block.
+    :return: list of indexes of affected classes
     """
-    fields1 = filled[ind1]
-    filled.pop(ind1, None)
-    fields2 = filled[ind2]
-    filled.pop(ind2, None)
+    group_names = {index: name for name, index in data.groups.items()}
+    teacher_names = {index: name for name, index in data.teachers.items()}
+    columns = {classroom.name: index for index, classroom in data.classrooms.items()}
+    # previous: dictionary where key = description of the class, value = start fields of such classes
+    previous = {}
+    for p in placements:
+        key = (p['subject'], p['type'], p['teacher'], tuple(sorted(p['groups'])), int(p['duration']))
+        previous.setdefault(key, []).append((p['row'], columns.get(p['classroom'])))
+
+    affected = []
+    for index, classs in data.classes.items():
+        duration = classs.duration
+        key = (classs.subject, classs.type, teacher_names[classs.teacher],
+               tuple(sorted(group_names[g] for g in classs.groups)), duration)
+        starts = previous.get(key)
+        if not starts:
+            affected.append(index)
+            continue
+        row, column = starts.pop(0)
+        fields = [(row + i, column) for i in range(duration)]
+        if column in classs.classrooms and 0 <= row and row % 12 + duration <= 12 and row + duration <= len(matrix) \
+                and all(field in free for field in fields) \
+                and all(valid_teacher_group_row(matrix, data, index, r) for r in range(row, row + duration)):
+            insert_class(matrix, data, index, fields, free, filled, groups_empty_space, teachers_empty_space,
+                         subjects_order)
+        else:
+            affected.append(index)
+
+    for index in affected:
+        classs = data.classes[index]
+        duration = classs.duration
+        start_field = None
+        for start in free.blocks(duration, classs.classrooms):
+            if all(valid_teacher_group_row(matrix, data, index, r) for r in range(start[0], start[0] + duration)):
+                start_field = start
+                break
+        if start_field is None:
+            start_field = free.first_block(duration, classs.classrooms)
+        if start_field is None:
+            raise ValueError('There is no free block for class {}'.format(index))
+        fields = [(start_field[0] + i, start_field[1]) for i in range(duration)]
+        insert_class(matrix, data, index, fields, free, filled, groups_empty_space, teachers_empty_space,
+                     subjects_order)
+    return affected
 
-    for i in range(len(fields1)):
-        t = matrix[fields1[i][0]][fields1[i][1]]
-        matrix[fields1[i][0]][fields1[i][1]] = matrix[fields2[i][0]][fields2[i][1]]
-        matrix[fields2[i][0]][fields2[i][1]] = t
 
-    filled[ind1] = fields2
-    filled[ind2] = fields1
+def insert_order(subjects_order, subject, group, type, start_time):
+    """
+    Inserts start time of the class for given subject, group and type of class. Start times of other classes of the
+    same type are kept (see SubjectsOrder).
+    """
+    subjects_order.insert((subject, group), type, start_time)
 
+
+def exchange_two(matrix, data, ind1, ind2, free, filled, groups_empty_space, teachers_empty_space, subjects_order,
+                 trackers=()):
+    """
+    Changes places of two classes with the same duration in timetable matrix. Classes are moved with remove_class and
+    insert_class, so empty space, order of subjects and trackers stay up to date.
+    """
+    fields1 = remove_class(matrix, data, ind1, free, filled, groups_empty_space, teachers_empty_space, subjects_order,
+                           trackers)
+    fields2 = remove_class(matrix, data, ind2, free, filled, groups_empty_space, teachers_empty_space, subjects_order,
+                           trackers)
+    insert_class(matrix, data, ind1, fields2, free, filled, groups_empty_space, teachers_empty_space, subjects_order,
+                 trackers)
+    insert_class(matrix, data, ind2, fields1, free, filled, groups_empty_space, teachers_empty_space, subjects_order,
+                 trackers)
     return matrix
 
 
 def valid_teacher_group_row(matrix, data, index_class, row):
     """
-    Returns if the class can be in that row because of possible teacher or groups overlaps.
+    Returns if the class can be in that row because of possible teacher or groups overlaps (class also can not be in
+    the row it is already in).
     """
-    c1 = data.classes[index_class]
-    for j in range(len(matrix[row])):
-        if matrix[row][j] is not None:
-            c2 = data.classes[matrix[row][j]]
-            # check teacher
-            if c1.teacher == c2.teacher:
-                return False
-            # check groups
-            for g in c2.groups:
-                if g in c1.groups:
-                    return False
+    teachers = data.teacher_conflicts[index_class]
+    groups = data.group_conflicts[index_class]
+    for field in matrix[row]:
+        if field is not None and (field == index_class or field in teachers or field in groups):
+            return False
     return True
 
 
-def mutate_ideal_spot(matrix, data, ind_class, free, filled, groups_empty_space, teachers_empty_space, subjects_order):
+def row_conflict(matrix, data, index_class, row):
     """
-    Function that tries to find new fields in matrix for class index where the cost of the class is 0 (taken into
-    account only hard constraints). If optimal spot is found, the fields in matrix are replaced.
+    Returns why the class can not be in that row ('same class', 'teacher clash' or 'group clash'), or None if it can.
     """
+    teachers = data.teacher_conflicts[index_class]
+    groups = data.group_conflicts[index_class]
+    for field in matrix[row]:
+        if field == index_class:
+            return 'same class'
+    for field in matrix[row]:
+        if field in teachers:
+            return 'teacher clash'
+    for field in matrix[row]:
+        if field in groups:
+            return 'group clash'
+    return None
 
-    # find rows and fields in which the class is currently in
-    rows = []
-    fields = filled[ind_class]
-    for f in fields:
-        rows.append(f[0])
+
+def mutate_ideal_spot(matrix, data, ind_class, free, filled, groups_empty_space, teachers_empty_space, subjects_order,
+                      trackers=(), stats=None, randomized=False):
+    """
+    Function that tries to find new fields in matrix for class index where the cost of the class is 0 (taken into
+    account only hard constraints). If optimal spot is found, the fields in matrix are replaced. Free blocks are
+    checked from the first one, or in random order if randomized is set.
+    Every tracker (e.g. HardConstraintsTracker) is notified about the fields that the class left and took.
+    If stats (profiling.Stats) is given, checks of rows are profiled and reasons why free blocks checked before the
+    spot was found were rejected are recorded ('same class', 'teacher clash', 'group clash'). Start fields that were
+    never candidates are counted separately: in other classrooms ('wrong room type'), at the end of a day ('day
+    boundary') or not free ('occupied slot').
+    :return: whether the class was moved
+    """
 
     classs = data.classes[ind_class]
-    ind = 0
-    while True:
-        # ideal spot is not found, return from function
-        if ind >= len(free):
-            return
-        start_field = free[ind]
-
-        # check if class won't start one day and end on the next
-        start_time = start_field[0]
-        end_time = start_time + int(classs.duration) - 1
-        if start_time % 12 > end_time % 12:
-            ind += 1
-            continue
+    duration = classs.duration
+    # valid_rows: dictionary where key = row, value = whether the class can be in that row
+    valid_rows = {}
+    blocks = free.blocks(duration, classs.classrooms)
+    valid_row = valid_teacher_group_row
+    if stats is not None:
+        valid_row = stats.profile(valid_teacher_group_row)
+        num_of_days = len(matrix) // 12
+        stats.exclude('wrong room type', len(matrix) * (len(matrix[0]) - len(classs.classrooms)))
+        stats.exclude('day boundary', num_of_days * (duration - 1) * len(classs.classrooms))
+        stats.exclude('occupied slot', num_of_days * (13 - duration) * len(classs.classrooms) - len(blocks))
+    if randomized:
+        random.shuffle(blocks)
 
-        # check if new classroom is suitable
-        if start_field[1] not in classs.classrooms:
-            ind += 1
-            continue
+    # go through free blocks in suitable classrooms which are in one day
+    for start_field in blocks:
+        start_time = start_field[0]
 
-        # check if whole block can be taken for new class and possible overlaps with teachers and groups
+        # check possible overlaps with teachers and groups for the whole block
         found = True
-        for i in range(int(classs.duration)):
-            field = (i + start_time, start_field[1])
-            if field not in free or not valid_teacher_group_row(matrix, data, ind_class, field[0]):
+        for row in range(start_time, start_time + duration):
+            if row not in valid_rows:
+                valid_rows[row] = valid_row(matrix, data, ind_class, row)
+            if not valid_rows[row]:
                 found = False
-                ind += 1
+                if stats is not None:
+                    stats.reject(row_conflict(matrix, data, ind_class, row))
                 break
 
         if found:
-            # remove current class from filled dict and add it to free dict
-            filled.pop(ind_class, None)
-            for f in fields:
-                free.append((f[0], f[1]))
-                matrix[f[0]][f[1]] = None
-                # remove empty space of the group from old place of the class
-                for group_index in classs.groups:
-                    groups_empty_space[group_index].remove(f[0])
-                # remove teacher's empty space from old place of the class
-                teachers_empty_space[classs.teacher].remove(f[0])
-
-            # update order of the subjects and add empty space for each group
-            for group_index in classs.groups:
-                insert_order(subjects_order, classs.subject, group_index, classs.type, start_time)
-                for i in range(int(classs.duration)):
-                    groups_empty_space[group_index].append(i + start_time)
-
-            # add new term of the class to filled, remove those fields from free dict and insert new block in matrix
-            for i in range(int(classs.duration)):
-                filled.setdefault(ind_class, []).append((i + start_time, start_field[1]))
-                free.remove((i + start_time, start_field[1]))
-                matrix[i + start_time][start_field[1]] = ind_class
-                # add new empty space for teacher
-                teachers_empty_space[classs.teacher].append(i+start_time)
-            break
+            remove_class(matrix, data, ind_class, free, filled, groups_empty_space, teachers_empty_space,
+                         subjects_order, trackers)
+            new_fields = [(i + start_time, start_field[1]) for i in range(duration)]
+            insert_class(matrix, data, ind_class, new_fields, free, filled, groups_empty_space, teachers_empty_space,
+                         subjects_order, trackers)
+            return True
+    return False
+
+
+def remove_class(matrix, data, ind_class, free, filled, groups_empty_space, teachers_empty_space, subjects_order,
+                 trackers=()):
+    """
+    Removes class from its fields in timetable matrix and returns those fields.
+    """
+    classs = data.classes[ind_class]
+
+    # remove current class from filled dict and add it to free dict
+    fields = filled.pop(ind_class)
+    # remove start time of the class from order of the subjects
+    for group_index in classs.groups:
+        subjects_order.remove((classs.subject, group_index), classs.type, fields[0][0])
+    for f in fields:
+        free.append((f[0], f[1]))
+        matrix[f[0]][f[1]] = None
+        # remove empty space of the group from old place of the class
+        for group_index in classs.groups:
+            groups_empty_space[group_index].remove(f[0])
+        # remove teacher's empty space from old place of the class
+        teachers_empty_space[classs.teacher].remove(f[0])
+    for tracker in trackers:
+        tracker.remove(ind_class, fields)
+    return fields
+
+
+def insert_class(matrix, data, ind_class, fields, free, filled, groups_empty_space, teachers_empty_space,
+                 subjects_order, trackers=()):
+    """
+    Inserts class into given free fields of timetable matrix (consecutive rows of one column).
+    """
+    classs = data.classes[ind_class]
+    start_time = fields[0][0]
+
+    # update order of the subjects and add empty space for each group
+    for group_index in classs.groups:
+        insert_order(subjects_order, classs.subject, group_index, classs.type, start_time)
+        for f in fields:
+            groups_empty_space[group_index].append(f[0])
+
+    # add new term of the class to filled, remove those fields from free dict and insert new block in matrix
+    for f in fields:
+        filled.setdefault(ind_class, []).append(f)
+        free.remove(f)
+        matrix[f[0]][f[1]] = ind_class
+        # add new empty space for teacher
+        teachers_empty_space[classs.teacher].append(f[0])
+    for tracker in trackers:
+        tracker.add(ind_class, fields)
+
+
+def rollback(journal, matrix, data, free, filled, groups_empty_space, teachers_empty_space, subjects_order,
+             trackers=()):
+    """
+    Reverts all moves recorded in the journal by replaying inverse operations in reverse order and clears the journal.
+    Given trackers are notified about the inverse moves.
+    """
+    for entry in reversed(journal.entries):
+        if entry[0] == 'add':
+            remove_class(matrix, data, entry[1], free, filled, groups_empty_space, teachers_empty_space,
+                         subjects_order, trackers)
+        else:
+            insert_class(matrix, data, entry[1], entry[2], free, filled, groups_empty_space, teachers_empty_space,
+                         subjects_order, trackers)
+    journal.clear()
+
+
+def random_free_block(matrix, data, ind_class, free):
+    """
+    Returns start field of a random free block for the class without teacher and group overlaps, or of a random free
+    block if there is no such block, or None if there are no free blocks in its classrooms.
+    """
+    classs = data.classes[ind_class]
+
+    def without_overlaps(start_field):
+        return all(valid_teacher_group_row(matrix, data, ind_class, row)
+                   for row in range(start_field[0], start_field[0] + classs.duration))
+    return free.random_block(classs.duration, classs.classrooms, without_overlaps)
+
+
+def swap_move(matrix, data, ind_class, free, filled, groups_empty_space, teachers_empty_space, subjects_order,
+              trackers=(), tracker=None, attempts=10, candidates=None):
+    """
+    Exchanges the class with a random class of the same duration, if both can be in the classroom of the other one.
+    If tracker (HardConstraintsTracker) is given, the first candidate whose exchange does not increase the cost of
+    hard constraints is taken, the cost is evaluated in O(duration) before classes are moved.
+    :param candidates: if given, the other class is chosen only among classes with these indexes
+    :return: whether the classes were exchanged
+    """
+    classs = data.classes[ind_class]
+    fields = filled[ind_class]
+    for _ in range(attempts):
+        other = random.randrange(len(data.classes)) if candidates is None else random.choice(candidates)
+        other_class = data.classes[other]
+        other_fields = filled[other]
+        if other == ind_class or other_class.duration != classs.duration or \
+                other_fields[0][1] not in classs.classrooms or fields[0][1] not in other_class.classrooms:
+            continue
+        if tracker is not None:
+            ignore = (ind_class, other)
+            before = tracker.cost_class[ind_class] + tracker.cost_class[other] - \
+                _pair_overlaps(data, ind_class, fields, other, other_fields)
+            after = tracker.conflicts(ind_class, other_fields, ignore) + tracker.conflicts(other, fields, ignore) + \
+                _pair_overlaps(data, ind_class, other_fields, other, fields)
+            if after > before:
+                continue
+        exchange_two(matrix, data, ind_class, other, free, filled, groups_empty_space, teachers_empty_space,
+                     subjects_order, trackers)
+        return True
+    return False
+
+
+def _pair_overlaps(data, ind1, fields1, ind2, fields2):
+    """
+    Returns number of overlaps between two classes in given fields, counted once (as in total cost).
+    """
+    rows = set(f[0] for f in fields1).intersection(f[0] for f in fields2)
+    if not rows:
+        return 0
+    overlaps = data.group_conflicts[ind1].get(ind2, 0) + (1 if ind2 in data.teacher_conflicts[ind1] else 0)
+    return overlaps * len(rows)
+
+
+def displace_move(matrix, data, ind_class, free, filled, groups_empty_space, teachers_empty_space, subjects_order,
+                  trackers=()):
+    """
+    Moves the class to a random block of its classrooms, which may be occupied. Classes in that block are displaced
+    and moved to random free blocks (see random_free_block).
+    :return: whether the class was moved, False if some displaced class has no free block (timetable is not changed
+    in that case only if no class was displaced yet, so the move should be made with journal)
+    """
+    classs = data.classes[ind_class]
+    duration = classs.duration
+    column = random.choice(classs.classrooms)
+    day = random.randrange(len(matrix) // 12)
+    start_time = day * 12 + random.randrange(13 - duration)
+    new_fields = [(start_time + i, column) for i in range(duration)]
+    if new_fields == filled[ind_class]:
+        return False
+
+    displaced = []
+    for row, col in new_fields:
+        index = matrix[row][col]
+        if index is not None and index != ind_class and index not in displaced:
+            displaced.append(index)
+    remove_class(matrix, data, ind_class, free, filled, groups_empty_space, teachers_empty_space, subjects_order,
+                 trackers)
+    for index in displaced:
+        remove_class(matrix, data, index, free, filled, groups_empty_space, teachers_empty_space, subjects_order,
+                     trackers)
+    insert_class(matrix, data, ind_class, new_fields, free, filled, groups_empty_space, teachers_empty_space,
+                 subjects_order, trackers)
+    for index in displaced:
+        start_field = random_free_block(matrix, data, index, free)
+        if start_field is None:
+            return False
+        fields = [(start_field[0] + i, start_field[1]) for i in range(data.classes[index].duration)]
+        insert_class(matrix, data, index, fields, free, filled, groups_empty_space, teachers_empty_space,
+                     subjects_order, trackers)
+    return True
 
 
-def evolutionary_algorithm(matrix, data, free, filled, groups_empty_space, teachers_empty_space, subjects_order):
+def kempe_move(matrix, data, ind_class, free, filled, groups_empty_space, teachers_empty_space, subjects_order,
+               trackers=()):
+    """
+    Kempe chain exchange between the time block of the class and another random block of the same length. Classes
+    that take exactly one of the two blocks and are connected with the class through teacher or group overlaps form
+    a chain, and all of them move to the other block, so overlaps between the two blocks are not created. Classes
+    keep their classrooms if possible, otherwise they take another free classroom of their type.
+    :return: whether the chain was moved, False if some class of the chain has no free classroom (timetable may be
+    changed in that case, so the move should be made with journal)
+    """
+    classs = data.classes[ind_class]
+    duration = classs.duration
+    start1 = filled[ind_class][0][0]
+    day = random.randrange(len(matrix) // 12)
+    start2 = day * 12 + random.randrange(13 - duration)
+    if start2 == start1:
+        return False
+
+    # classes that take exactly one of the blocks: dictionary where key = index, value = start of its block
+    block_classes = {}
+    for start in (start1, start2):
+        for index in matrix[start]:
+            if index is not None and data.classes[index].duration == duration and filled[index][0][0] == start:
+                block_classes[index] = start
+
+    chain = [ind_class]
+    in_chain = {ind_class}
+    for index in chain:
+        conflicts = data.teacher_conflicts[index]
+        groups = data.group_conflicts[index]
+        for other, start in block_classes.items():
+            if other not in in_chain and start != block_classes[index] and (other in conflicts or other in groups):
+                chain.append(other)
+                in_chain.add(other)
+
+    old_fields = {}
+    for index in chain:
+        old_fields[index] = remove_class(matrix, data, index, free, filled, groups_empty_space, teachers_empty_space,
+                                         subjects_order, trackers)
+    for index in chain:
+        start = start2 if block_classes[index] == start1 else start1
+        column = old_fields[index][0][1]
+        fields = [(start + i, column) for i in range(duration)]
+        if not all(f in free for f in fields):
+            columns = [c for c in data.classes[index].classrooms
+                       if all((start + i, c) in free for i in range(duration))]
+            if not columns:
+                return False
+            fields = [(start + i, random.choice(columns)) for i in range(duration)]
+        insert_class(matrix, data, index, fields, free, filled, groups_empty_space, teachers_empty_space,
+                     subjects_order, trackers)
+    return True
+
+
+def try_move(move, journal, tracker, matrix, data, ind_class, free, filled, groups_empty_space, teachers_empty_space,
+             subjects_order, trackers=()):
+    """
+    Makes the move (displace_move or kempe_move) with journal and undoes it if it failed or increased the cost of
+    hard constraints given by tracker, which has to be one of the trackers.
+    :return: whether the move was kept
+    """
+    before = tracker.total
+    moved = move(matrix, data, ind_class, free, filled, groups_empty_space, teachers_empty_space, subjects_order,
+                 list(trackers) + [journal])
+    if not moved or tracker.total > before:
+        rollback(journal, matrix, data, free, filled, groups_empty_space, teachers_empty_space, subjects_order,
+                 trackers)
+        return False
+    journal.clear()
+    return True
+
+
+def evolutionary_algorithm(matrix, data, free, filled, groups_empty_space, teachers_empty_space, subjects_order,
+                           config=None, max_iterations=None, trackers=(), budget=None, progress=None, stats=None,
+                           movable=None):
     """
     Evolutionary algorithm that tires to find schedule such that hard constraints are satisfied.
     It uses (1+1) evolutionary strategy with Stifel's notation.
+    Cost of hard constraints is maintained incrementally by HardConstraintsTracker, check_hard_constraints is used only
+    to confirm the final solution. Classes are moved only to places without overlaps, so the cost never increases and
+    the current timetable is always the best one found so far. With config.moves = 'all', class is moved to a random
+    spot without overlaps, and if there is none, it is exchanged with another class, displaces other classes or takes
+    part in a Kempe chain exchange (see swap_move, displace_move and kempe_move), if that does not increase the cost.
+    :param config: parameters of the algorithm (Config)
+    :param max_iterations: if given, algorithm stops after that many iterations in total
+    :param trackers: additional trackers notified about every move
+    :param budget: if given, algorithm stops when it is exhausted (Budget)
+    :param progress: callback called with events of the algorithm, see progress.py
+    :param stats: if given, calls on the hot path are profiled (profiling.Stats)
+    :param movable: if given, only classes with these indexes are moved
+    :return: cost of hard constraints at the end
     """
-    n = 3
-    sigma = 2
-    run_times = 5
-    max_stagnation = 200
+    if config is None:
+        config = Config()
+    if progress is None:
+        progress = no_progress
+    mutate, check = mutate_ideal_spot, check_hard_constraints
+    movable_set = set(movable) if movable is not None else None
+    # other moves can move more classes, so they are not used when only some classes are movable
+    use_library = config.moves == 'all' and movable is None
+    library = [swap_move, displace_move, kempe_move]
+    if stats is not None:
+        library = [stats.profile(move) for move in library]
+    journal = MoveJournal()
+    if stats is not None:
+        mutate, check = stats.profile(mutate_ideal_spot), stats.profile(check_hard_constraints)
+    start = time.perf_counter()
+    n = config.n
+    sigma = config.sigma
+    run_times = config.run_times
+    max_stagnation = config.max_stagnation
+    tracker = HardConstraintsTracker(data, filled)
+    trackers = [tracker] + list(trackers)
+    loss_after, _, cost_teachers, cost_classrooms, cost_groups = tracker.costs()
+    iterations = 0
+    moves = 0
+    progress({'event': 'phase_start', 'phase': 'evolutionary', 'elapsed': 0.0, 'cost': loss_after})
 
     for run in range(run_times):
-        print('Run {} | sigma = {}'.format(run + 1, sigma))
-
         t = 0
+        improvements = 0
         stagnation = 0
         cost_stats = 0
-        while stagnation < max_stagnation:
+        while stagnation < max_stagnation and (max_iterations is None or iterations < max_iterations):
 
             # check if optimal solution is found
-            loss_before, cost_classes, cost_teachers, cost_classrooms, cost_groups = hard_constraints_cost(matrix, data)
-            if loss_before == 0 and check_hard_constraints(matrix, data) == 0:
-                print('Found optimal solution: \n')
-                show_timetable(matrix)
+            loss_before, cost_classes, cost_teachers, cost_classrooms, cost_groups = tracker.costs()
+            if loss_before == 0 and check(matrix, data) == 0:
                 break
+            if budget is not None:
+                if budget.exhausted():
+                    break
+                budget.spend()
 
             # sort classes by their loss, [(loss, class index)]
             costs_list = sorted(cost_classes.items(), key=itemgetter(1), reverse=True)
+            if movable is not None:
+                costs_list = [item for item in costs_list if item[0] in movable_set]
 
             # 10*n
-            for i in range(len(costs_list) // 4):
+            for i in range(len(costs_list) // 4 or len(costs_list)):
                 # mutate one to its ideal spot
                 if random.uniform(0, 1) < sigma and costs_list[i][1] != 0:
-                    mutate_ideal_spot(matrix, data, costs_list[i][0], free, filled, groups_empty_space,
-                                      teachers_empty_space, subjects_order)
-                # else:
-                #     # exchange two who have the same duration
-                #     r = random.randrange(len(costs_list))
-                #     c1 = data.classes[costs_list[i][0]]
-                #     c2 = data.classes[costs_list[r][0]]
-                #     if r != i and costs_list[r][1] != 0 and costs_list[i][1] != 0 and c1.duration == c2.duration:
-                #         exchange_two(matrix, filled, costs_list[i][0], costs_list[r][0])
-
-            loss_after, _, _, _, _ = hard_constraints_cost(matrix, data)
+                    index = costs_list[i][0]
+                    moves += 1
+                    if not use_library:
+                        mutate(matrix, data, index, free, filled, groups_empty_space, teachers_empty_space,
+                               subjects_order, trackers, stats)
+                    elif not mutate(matrix, data, index, free, filled, groups_empty_space, teachers_empty_space,
+                                    subjects_order, trackers, stats, randomized=True):
+                        # there is no free spot without overlaps, try other moves that do not increase the cost
+                        k = random.randrange(len(library))
+                        if k == 0:
+                            library[k](matrix, data, index, free, filled, groups_empty_space, teachers_empty_space,
+                                       subjects_order, trackers, tracker)
+                        else:
+                            try_move(library[k], journal, tracker, matrix, data, index, free, filled,
+                                     groups_empty_space, teachers_empty_space, subjects_order, trackers)
+
+            loss_after, _, cost_teachers, cost_classrooms, cost_groups = tracker.costs()
             if loss_after < loss_before:
                 stagnation = 0
                 cost_stats += 1
+                improvements += 1
             else:
                 stagnation += 1
 
             t += 1
+            iterations += 1
+            progress(_evolutionary_event('iteration', run, t, loss_after, sigma, cost_teachers, cost_groups,
+                                         cost_classrooms, improvements, start))
             # Stifel for (1+1)-ES
             if t >= 10*n and t % n == 0:
                 s = cost_stats
@@ -242,99 +626,517 @@ def evolutionary_algorithm(matrix, data, free, filled, groups_empty_space, teach
                     sigma /= 0.85
                 cost_stats = 0
 
-        print('Number of iterations: {} \nCost: {} \nTeachers cost: {} | Groups cost: {} | Classrooms cost:'
-              ' {}'.format(t, loss_after, cost_teachers, cost_groups, cost_classrooms))
+        progress(_evolutionary_event('run_end', run, t, loss_after, sigma, cost_teachers, cost_groups, cost_classrooms,
+                                     improvements, start))
+        if max_iterations is not None and iterations >= max_iterations:
+            break
+        if budget is not None and budget.exhausted():
+            break
+
+    progress({'event': 'phase_end', 'phase': 'evolutionary', 'elapsed': time.perf_counter() - start,
+              'iteration': iterations, 'cost': tracker.total, 'moves': moves})
+    return tracker.total
+
+
+def _evolutionary_event(kind, run, iteration, cost, sigma, cost_teachers, cost_groups, cost_classrooms, improvements,
+                        start):
+    return {'event': kind, 'phase': 'evolutionary', 'elapsed': time.perf_counter() - start, 'run': run + 1,
+            'iteration': iteration, 'cost': cost, 'sigma': sigma, 'teachers_cost': cost_teachers,
+            'groups_cost': cost_groups, 'classrooms_cost': cost_classrooms,
+            'acceptance_rate': improvements / iteration if iteration else 0.0}
+
+
+def soft_constraints_cost(soft, timetable=None):
+    """
+    Cost optimised by simulated hardening: weighted sum of terms of the soft constraints cost (see soft_cost_terms and
+    Config.weights), taken from SoftConstraintsTracker. If array-backed timetable is given, empty space and free hour
+    are computed by vectorized cost functions instead.
+    """
+    if timetable is None:
+        return soft.cost()
+    _, groups_max, groups_average = timetable.empty_space_groups_cost()
+    _, teachers_max, teachers_average = timetable.empty_space_teachers_cost()
+    violated, total = soft.subjects_order.violated, soft.subjects_order.total
+    terms = {
+        'groups': groups_average,
+        'teachers': teachers_average,
+        'max_gap': max(groups_max, teachers_max),
+        'order': violated / total if total else 0.0,
+        'free_hour': 1 if timetable.free_hour() == -1 else 0,
+    }
+    return weighted_soft_cost(terms, soft.weights)
 
 
-def simulated_hardening(matrix, data, free, filled, groups_empty_space, teachers_empty_space, subjects_order, file):
+def initial_temperature(deltas, acceptance):
     """
-    Algorithm that uses simulated hardening with geometric decrease of temperature to optimize timetable by satisfying
-    soft constraints as much as possible (empty space for groups and existence of an hour in which there is no classes).
+    Returns temperature at which a move that increases the cost by the average of positive deltas is accepted with
+    given probability, or None if no delta is positive.
+    :param deltas: changes of the cost made by sampled moves
     """
+    uphill = [delta for delta in deltas if delta > 0]
+    if not uphill:
+        return None
+    return -(sum(uphill) / len(uphill)) / math.log(acceptance)
+
+
+def simulated_hardening(matrix, data, free, filled, groups_empty_space, teachers_empty_space, subjects_order,
+                        config=None, trackers=(), budget=None, progress=None, stats=None, movable=None):
+    """
+    Algorithm that uses simulated hardening to optimize timetable by satisfying soft constraints as much as possible.
+    The cost is weighted sum of empty space of groups and teachers, maximum empty space in a day, violated orders of
+    subjects and nonexistence of an hour in which there is no classes (see Config.weights). Temperature decreases
+    geometrically or follows the adaptive schedule (see Config.schedule), in which case it starts from a temperature
+    calibrated on sampled moves, is raised again when the search freezes and the algorithm stops early when
+    reheating is no longer allowed.
+    With Config.step 'batch', every iteration moves 1/4 of the classes to their first spot without overlaps and
+    accepts or rejects all of these moves at once. With 'single', every iteration makes the same number of Metropolis
+    steps, each of them moves one class (to a random spot without overlaps or by exchange with a class of the same
+    duration that does not add overlaps) and is accepted or rejected by its own change of the cost.
+    Backend 'numpy' evaluates empty space and free hour on array-backed timetable (requires NumPy), 'python' keeps all
+    terms up to date with SoftConstraintsTracker, so the cost after a move takes time proportional to the classes it
+    moved; 'numpy' is allowed only with batch steps. Given trackers are additionally notified about every move (and its
+    undoing).
+    The best timetable found is saved whenever it improves, and restored at the end (also when budget is exhausted).
+    :param config: parameters of the algorithm (Config)
+    :param budget: if given, algorithm stops when it is exhausted, every step (evaluation of the cost after a move) is
+    one evaluation (Budget)
+    :param progress: callback called with events of the algorithm, see progress.py
+    :param stats: if given, calls on the hot path are profiled and moves are counted per temperature (profiling.Stats)
+    :param movable: if given, only classes with these indexes are moved
+    :return: cost of the timetable at the end
+    """
+    if config is None:
+        config = Config()
+    if progress is None:
+        progress = no_progress
+    mutate, swap, cost, undo, save = mutate_ideal_spot, swap_move, soft_constraints_cost, rollback, save_timetable
+    if stats is not None:
+        mutate, swap, cost, undo, save = stats.profile(mutate_ideal_spot), stats.profile(swap_move), \
+            stats.profile(soft_constraints_cost), stats.profile(rollback), stats.profile(save_timetable)
+    start = time.perf_counter()
+    adaptive = config.schedule == 'adaptive'
+    single = config.step == 'single'
     # number of iterations
-    iter_count = 2500
+    iter_count = config.iter_count
     # temperature
-    t = 0.5
-    _, _, curr_cost_group = empty_space_groups_cost(groups_empty_space)
-    _, _, curr_cost_teachers = empty_space_teachers_cost(teachers_empty_space)
-    curr_cost = curr_cost_group  # + curr_cost_teachers
-    if free_hour(matrix) == -1:
-        curr_cost += 1
+    t = config.temperature
+    # moves made in current step, so they can be undone if the new timetable is rejected
+    journal = MoveJournal()
+    soft = SoftConstraintsTracker(data, filled, subjects_order, config.weights, len(matrix))
+    if config.backend == 'numpy':
+        timetable = ArrayTimetable(data, matrix)
+        trackers = [soft, timetable] + list(trackers)
+    else:
+        timetable = None
+        trackers = [soft] + list(trackers)
+    if single:
+        # exchanges are allowed only if they do not add overlaps
+        hard = HardConstraintsTracker(data, filled)
+        trackers.append(hard)
+    num_of_moves = len(data.classes) // 4 if movable is None else len(movable) // 4 or len(movable)
+    # batch: one step of 1/4 of (movable) classes per iteration, single: 1/4 of (movable) classes steps of one class
+    steps, moves_per_step = (num_of_moves, 1) if single else (1, num_of_moves)
+
+    def propose():
+        # moves classes and returns the new cost, or None if no class was moved
+        moved = False
+        for j in range(moves_per_step):
+            index_class = random.randrange(len(data.classes)) if movable is None else random.choice(movable)
+            if not single:
+                moved |= mutate(matrix, data, index_class, free, filled, groups_empty_space, teachers_empty_space,
+                                subjects_order, trackers + [journal], stats)
+            elif random.random() < 0.5:
+                moved |= mutate(matrix, data, index_class, free, filled, groups_empty_space, teachers_empty_space,
+                                subjects_order, trackers + [journal], stats, randomized=True)
+            else:
+                moved |= swap(matrix, data, index_class, free, filled, groups_empty_space, teachers_empty_space,
+                              subjects_order, trackers + [journal], hard, candidates=movable)
+        return cost(soft, timetable) if moved else None
+
+    curr_cost = cost(soft, timetable)
+    # the best timetable found so far
+    best_cost = curr_cost
+    best_filled = save(filled)
+    progress({'event': 'phase_start', 'phase': 'hardening', 'elapsed': 0.0, 'cost': curr_cost})
+    accepted = 0
+    decisions = 0
+    iterations = 0
+
+    initial_t = t
+    # uphill: steps that increased the cost in the current window and how many of them were accepted
+    uphill = uphill_accepted = 0
+    last_improvement = 0
+    reheats = 0
+    calibrating = adaptive
+    deltas = []
 
     for i in range(iter_count):
-        rt = random.uniform(0, 1)
-        t *= 0.99                   # geometric decrease of temperature
-
-        # save current results
-        old_matrix = copy.deepcopy(matrix)
-        old_free = copy.deepcopy(free)
-        old_filled = copy.deepcopy(filled)
-        old_groups_empty_space = copy.deepcopy(groups_empty_space)
-        old_teachers_empty_space = copy.deepcopy(teachers_empty_space)
-        old_subjects_order = copy.deepcopy(subjects_order)
-
-        # try to mutate 1/4 of all classes
-        for j in range(len(data.classes) // 4):
-            index_class = random.randrange(len(data.classes))
-            mutate_ideal_spot(matrix, data, index_class, free, filled, groups_empty_space, teachers_empty_space,
-                              subjects_order)
-        _, _, new_cost_groups = empty_space_groups_cost(groups_empty_space)
-        _, _, new_cost_teachers = empty_space_teachers_cost(teachers_empty_space)
-        new_cost = new_cost_groups  # + new_cost_teachers
-        if free_hour(matrix) == -1:
-            new_cost += 1
-
-        if new_cost < curr_cost or rt <= math.exp((curr_cost - new_cost) / t):
-            # take new cost and continue with new data
-            curr_cost = new_cost
-        else:
-            # return to previously saved data
-            matrix = copy.deepcopy(old_matrix)
-            free = copy.deepcopy(old_free)
-            filled = copy.deepcopy(old_filled)
-            groups_empty_space = copy.deepcopy(old_groups_empty_space)
-            teachers_empty_space = copy.deepcopy(old_teachers_empty_space)
-            subjects_order = copy.deepcopy(old_subjects_order)
-        if i % 100 == 0:
-            print('Iteration: {:4d} | Average cost: {:0.8f}'.format(i, curr_cost))
-
-    print('TIMETABLE AFTER HARDENING')
-    show_timetable(matrix)
-    print('STATISTICS AFTER HARDENING')
-    show_statistics(matrix, data, subjects_order, groups_empty_space, teachers_empty_space)
-    write_solution_to_file(matrix, data, filled, file, groups_empty_space, teachers_empty_space, subjects_order)
+        if budget is not None and budget.exhausted():
+            break
+        if not adaptive or calibrating:
+            t *= config.cooling         # geometric decrease of temperature
+
+        for _ in range(steps):
+            if budget is not None:
+                if budget.exhausted():
+                    break
+                budget.spend()
+            rt = random.uniform(0, 1)
+            new_cost = propose()
+            if new_cost is None:
+                continue
+            accept = new_cost <= curr_cost or rt <= math.exp((curr_cost - new_cost) / t)
+            decisions += 1
+            if new_cost > curr_cost:
+                uphill += 1
+                uphill_accepted += accept
+                if calibrating:
+                    deltas.append(new_cost - curr_cost)
+            if stats is not None:
+                stats.record_move(t, accept)
+            if accept:
+                # take new cost and continue with new data
+                curr_cost = new_cost
+                accepted += 1
+                journal.clear()
+                if curr_cost < best_cost:
+                    best_cost = curr_cost
+                    best_filled = save(filled)
+                    last_improvement = i
+            else:
+                # return to previous timetable by undoing the moves
+                undo(journal, matrix, data, free, filled, groups_empty_space, teachers_empty_space, subjects_order,
+                     trackers)
+        iterations += 1
+        progress({'event': 'iteration', 'phase': 'hardening', 'elapsed': time.perf_counter() - start, 'iteration': i,
+                  'cost': curr_cost, 'best_cost': best_cost, 'temperature': t,
+                  'acceptance_rate': accepted / decisions if decisions else 0.0})
+        if best_cost == 0:
+            # soft constraints can not be satisfied better
+            break
+
+        if calibrating and iterations == config.window:
+            # first window is run with geometric schedule to sample increases of the cost
+            calibrating = False
+            t = initial_t = initial_temperature(deltas, config.target_acceptance) or t
+            uphill = uphill_accepted = 0
+        elif adaptive and iterations % config.window == 0:
+            # acceptance of steps that increase the cost should follow target that decreases geometrically
+            target = config.target_acceptance * (config.final_acceptance / config.target_acceptance) ** \
+                (i / iter_count)
+            rate = uphill_accepted / uphill if uphill else 0.0
+            if rate > target:
+                t *= config.cooling ** (2 * config.window)
+            elif rate >= target / 2:
+                t *= config.cooling ** config.window
+            uphill = uphill_accepted = 0
+            # search is frozen: raise temperature or stop
+            if rate < config.final_acceptance and i - last_improvement >= config.reheat_after:
+                if reheats == config.max_reheats:
+                    break
+                reheats += 1
+                t = initial_t / 2 ** reheats
+                last_improvement = i
+
+    if best_cost < curr_cost:
+        restore_timetable(best_filled, matrix, data, free, filled, groups_empty_space, teachers_empty_space,
+                          subjects_order, trackers)
+    progress({'event': 'phase_end', 'phase': 'hardening', 'elapsed': time.perf_counter() - start,
+              'iteration': iterations, 'cost': best_cost, 'best_cost': best_cost, 'temperature': t,
+              'acceptance_rate': accepted / decisions if decisions else 0.0, 'reheats': reheats, 'steps': decisions,
+              'accepted': accepted, 'terms': soft.terms()})
+    return best_cost
+
+
+def save_timetable(filled):
+    """
+    Returns copies of fields of all classes, which are enough to restore the timetable (start times of subjects follow
+    the classes).
+    """
+    return {index: list(fields) for index, fields in filled.items()}
+
+
+def restore_timetable(saved_filled, matrix, data, free, filled, groups_empty_space, teachers_empty_space,
+                      subjects_order, trackers=()):
+    """
+    Restores timetable saved by save_timetable by moving back only the classes whose fields changed.
+    """
+    moved = [index for index, fields in saved_filled.items() if filled[index] != fields]
+    for index in moved:
+        remove_class(matrix, data, index, free, filled, groups_empty_space, teachers_empty_space, subjects_order,
+                     trackers)
+    for index in moved:
+        insert_class(matrix, data, index, list(saved_filled[index]), free, filled, groups_empty_space,
+                     teachers_empty_space, subjects_order, trackers)
+
+
+def place_classes(data, filled):
+    """
+    Builds timetable matrix and helper structures from already known fields of classes (e.g. from other process).
+    :param filled: dictionary where key = index of the class, value = list of fields in matrix
+    :return: matrix, free, filled, groups_empty_space, teachers_empty_space, subjects_order
+    """
+    groups_empty_space, teachers_empty_space, subjects_order = set_up_structures(data)
+    matrix, free = set_up(len(data.classrooms))
+    placed = {}
+    for index, fields in filled.items():
+        insert_class(matrix, data, index, list(fields), free, placed, groups_empty_space, teachers_empty_space,
+                     subjects_order)
+    return matrix, free, placed, groups_empty_space, teachers_empty_space, subjects_order
+
+
+def solve(data, config=None, progress=None, previous=None, evolve=None):
+    """
+    Runs the whole algorithm on loaded data: initial population, evolutionary algorithm (or genetic algorithm, see
+    Config.method) for hard constraints and simulated hardening for soft constraints. Data is not changed, so it can
+    be shared by more runs.
+    Algorithm stops early when time limit or maximum number of evaluations from config is reached, or on SIGINT (when
+    called from the main thread), and returns the best timetable found until then.
+    If previous solution is given (warm start), its still valid placements are kept (see place_previous) and only
+    affected classes are moved. Other classes are moved only if overlaps can not be removed otherwise.
+    :param data: input data, contains classes, classrooms, teachers and groups
+    :param config: parameters of the algorithm (Config)
+    :param progress: callback called with events of all phases, see progress.py (nothing is reported by default)
+    :param previous: placements of classes in previous solution, e.g. returned by read_solution_file
+    :param evolve: function that removes overlaps instead of evolutionary_algorithm, takes the same arguments, changes
+    the timetable in place and returns cost of hard constraints (e.g. island model from parallel.py)
+    :return: Result
+    """
+    if config is None:
+        config = Config()
+    if progress is None:
+        progress = no_progress
+    if evolve is None:
+        evolve = evolutionary_algorithm
+    budget = Budget(config.time_limit, config.max_evaluations)
+    handle_interrupt = threading.current_thread() is threading.main_thread()
+    if handle_interrupt:
+        previous_handler = signal.signal(signal.SIGINT, lambda signum, frame: setattr(budget, 'interrupted', True))
+    try:
+        return _solve(data, config, budget, progress, previous, evolve)
+    finally:
+        if handle_interrupt:
+            signal.signal(signal.SIGINT, previous_handler)
+
+
+def _solve(data, config, budget, progress, previous=None, evolve=evolutionary_algorithm):
+    start = time.perf_counter()
+    random.seed(config.seed)
+    filled = {}
+    groups_empty_space, teachers_empty_space, subjects_order = set_up_structures(data)
+    matrix, free = set_up(len(data.classrooms))
+
+    # phases are profiled as a whole too, their times include times of the functions they call
+    stats = Stats() if config.profile else None
+    phase = stats.profile if stats is not None else (lambda function: function)
+
+    progress({'event': 'phase_start', 'phase': 'initial', 'elapsed': 0.0})
+    # affected: indexes of classes that can be moved, None if all can
+    affected = None
+    # unplaced: indexes of classes that constructive heuristic could not place without overlaps
+    unplaced = None
+    if previous is None and config.initial == 'constructive':
+        try:
+            unplaced = phase(constructive_population)(data, matrix, free, filled, groups_empty_space,
+                                                      teachers_empty_space, subjects_order)
+        except ValueError:
+            # free fields were too fragmented for some class, start again with the first free blocks
+            filled = {}
+            groups_empty_space, teachers_empty_space, subjects_order = set_up_structures(data)
+            matrix, free = set_up(len(data.classrooms))
+    if previous is None and unplaced is None:
+        phase(initial_population)(data, matrix, free, filled, groups_empty_space, teachers_empty_space,
+                                  subjects_order)
+    elif previous is not None:
+        affected = phase(place_previous)(data, previous, matrix, free, filled, groups_empty_space,
+                                         teachers_empty_space, subjects_order)
+    total, _, _, _, _ = hard_constraints_cost(matrix, data)
+    event = {'event': 'phase_end', 'phase': 'initial', 'elapsed': time.perf_counter() - start, 'iteration': 0,
+             'cost': total}
+    if affected is not None:
+        event['affected'] = len(affected)
+    if unplaced is not None:
+        event['unplaced'] = unplaced
+    progress(event)
+
+    if config.method == 'ga' and previous is None:
+        _, filled = phase(genetic_algorithm)(data, filled, config.population_size, config.generations,
+                                             config.crossover_rate, config.mutation_rate, config.tournament_size,
+                                             config.elite, budget=budget, progress=progress)
+        matrix, free, filled, groups_empty_space, teachers_empty_space, subjects_order = place_classes(data, filled)
+    cost = phase(evolve)(matrix, data, free, filled, groups_empty_space, teachers_empty_space, subjects_order, config,
+                         budget=budget, progress=progress, stats=stats, movable=affected)
+    if cost > 0 and affected is not None:
+        # overlaps could not be removed by moving only affected classes
+        phase(evolve)(matrix, data, free, filled, groups_empty_space, teachers_empty_space, subjects_order, config,
+                      budget=budget, progress=progress, stats=stats)
+    phase(simulated_hardening)(matrix, data, free, filled, groups_empty_space, teachers_empty_space, subjects_order,
+                               config, budget=budget, progress=progress, stats=stats, movable=affected)
+
+    statistics = get_statistics(matrix, data, subjects_order, groups_empty_space, teachers_empty_space,
+                                config.weights)
+    stop_reason = budget.stop_reason()
+    progress({'event': 'finish', 'phase': 'solve', 'elapsed': time.perf_counter() - start, 'stop_reason': stop_reason})
+    return Result(matrix, filled, groups_empty_space, teachers_empty_space, subjects_order, statistics, stop_reason,
+                  stats)
 
 
 def main():
     """
-    free = [(row, column)...] - list of free fields (row, column) in matrix
+    free: FreeFields - free fields (row, column) in matrix, indexed by column
     filled: dictionary where key = index of the class, value = list of fields in matrix
 
-    subjects_order: dictionary where key = (name of the subject, index of the group), value = [int, int, int]
-    where ints represent start times (row in matrix) for types of classes P, V and L respectively
+    subjects_order: SubjectsOrder - for key = (name of the subject, index of the group), sorted start times (rows in
+    matrix) of its classes of types P, V and L, and number of violated orders of types
     groups_empty_space: dictionary where key = group index, values = list of rows where it is in
-    teachers_empty_space: dictionary where key = name of the teacher, values = list of rows where it is in
+    teachers_empty_space: dictionary where key = index of the teacher, values = list of rows where it is in
 
     matrix = columns are classrooms, rows are times, each field has index of the class or it is empty
     data = input data, contains classes, classrooms, teachers and groups
     """
-    filled = {}
-    subjects_order = {}
-    groups_empty_space = {}
-    teachers_empty_space = {}
-    file = 'ulaz1.txt'
+    default = Config()
+    parser = argparse.ArgumentParser(description='Generates timetable for classes from input file.')
+    parser.add_argument('input', nargs='?', default='test_files/ulaz1.txt', help='path to input file')
+    parser.add_argument('-o', '--output', help='path to solution file, by default solution_files/sol_<input name>')
+    parser.add_argument('--seed', type=int, default=default.seed)
+    parser.add_argument('--time-limit', type=float, default=default.time_limit,
+                        help='time limit for the whole algorithm in seconds')
+    parser.add_argument('--max-evaluations', type=int, default=default.max_evaluations,
+                        help='maximum number of cost evaluations for the whole algorithm')
+    parser.add_argument('--cache-dir', help='directory where compiled input data is cached')
+    parser.add_argument('--backend', choices=['python', 'numpy'], default=default.backend,
+                        help='numpy - array-backed timetable with vectorized costs for simulated hardening, only with '
+                             '--step batch')
+    parser.add_argument('--method', choices=['es', 'ga'], default=default.method,
+                        help='es - (1+1) evolutionary strategy, ga - genetic algorithm for hard constraints')
+    parser.add_argument('--initial', choices=['constructive', 'first'], default=default.initial,
+                        help='constructive - greedy placement of the most constrained classes first without overlaps, '
+                             'first - every class in the first free block')
+    parser.add_argument('--moves', choices=['ideal', 'all'], default=default.moves,
+                        help='ideal - move classes only to the first spot without overlaps, all - also exchanges, '
+                             'displacements and Kempe chains')
+    parser.add_argument('--n', type=int, default=default.n, help="Stifel's n of evolutionary algorithm")
+    parser.add_argument('--sigma', type=float, default=default.sigma, help='initial sigma of evolutionary algorithm')
+    parser.add_argument('--run-times', type=int, default=default.run_times,
+                        help='number of runs of evolutionary algorithm')
+    parser.add_argument('--max-stagnation', type=int, default=default.max_stagnation,
+                        help='maximum iterations without improvement in one run of evolutionary algorithm')
+    parser.add_argument('--population-size', type=int, default=default.population_size,
+                        help='number of individuals of genetic algorithm')
+    parser.add_argument('--generations', type=int, default=default.generations,
+                        help='maximum number of generations of genetic algorithm')
+    parser.add_argument('--crossover-rate', type=float, default=default.crossover_rate,
+                        help='probability of crossover in genetic algorithm')
+    parser.add_argument('--mutation-rate', type=float, default=default.mutation_rate,
+                        help='probability of moving each class in genetic algorithm, by default 1 / number of classes')
+    parser.add_argument('--tournament-size', type=int, default=default.tournament_size,
+                        help='size of tournaments of genetic algorithm')
+    parser.add_argument('--elite', type=int, default=default.elite,
+                        help='number of the best individuals kept in every generation of genetic algorithm')
+    parser.add_argument('--iterations', type=int, default=default.iter_count,
+                        help='number of iterations of simulated hardening')
+    parser.add_argument('--temperature', type=float, default=default.temperature,
+                        help='initial temperature of simulated hardening')
+    parser.add_argument('--cooling', type=float, default=default.cooling,
+                        help='factor by which temperature is decreased in each iteration')
+    parser.add_argument('--schedule', choices=['geometric', 'adaptive'], default=default.schedule,
+                        help='cooling schedule of simulated hardening: geometric (--temperature, --cooling) or '
+                             'adaptive (calibrated initial temperature, cooling by acceptance rate, reheats and early '
+                             'stop)')
+    parser.add_argument('--step', choices=['batch', 'single'], default=default.step,
+                        help='simulated hardening: batch - accept or reject moves of 1/4 of classes together, single - '
+                             'accept or reject every move of one class by its own change of the cost')
+    parser.add_argument('--weight', action='append', default=[], metavar='TERM=WEIGHT',
+                        help='weight of a term of the soft constraints cost optimised by simulated hardening, terms '
+                             'are ' + ', '.join(SOFT_TERMS) + ' (can be given more times)')
+    parser.add_argument('--target-acceptance', type=float, default=default.target_acceptance,
+                        help='adaptive schedule: initial acceptance rate of moves that increase the cost')
+    parser.add_argument('--final-acceptance', type=float, default=default.final_acceptance,
+                        help='adaptive schedule: acceptance rate of moves that increase the cost at the end, under '
+                             'which the search is frozen')
+    parser.add_argument('--window', type=int, default=default.window,
+                        help='adaptive schedule: number of iterations after which the cooling is adjusted')
+    parser.add_argument('--reheat-after', type=int, default=default.reheat_after,
+                        help='adaptive schedule: iterations without improvement after which frozen search is reheated')
+    parser.add_argument('--max-reheats', type=int, default=default.max_reheats,
+                        help='adaptive schedule: number of reheats before simulated hardening stops early')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not print progress')
+    parser.add_argument('--progress-file', help='write progress events as JSON lines to this file instead of printing')
+    parser.add_argument('--show-timetable', action='store_true', help='print the final timetable')
+    parser.add_argument('--show-statistics', action='store_true', help='print statistics of the final timetable')
+    parser.add_argument('--format', choices=['text', 'jsonl'], default='text',
+                        help='format of solution file: text report or JSON lines that can be read back')
+    parser.add_argument('--warm-start', metavar='SOLUTION',
+                        help='start from previous solution file (text or JSON lines), keep its valid placements and '
+                             'move only the rest')
+    parser.add_argument('--profile', action='store_true',
+                        help='profile the algorithm, print summary and write it to <output>.stats.json')
+    args = parser.parse_args()
+    weights = {}
+    for item in args.weight:
+        term, _, weight = item.partition('=')
+        if term not in SOFT_TERMS:
+            parser.error('unknown term of soft constraints cost: {}'.format(term))
+        try:
+            weights[term] = float(weight)
+        except ValueError:
+            parser.error('invalid weight: {}'.format(item))
+    if args.backend == 'numpy' and args.step == 'single':
+        parser.error('--backend numpy requires --step batch')
 
-    data = load_data('test_files/' + file, teachers_empty_space, groups_empty_space, subjects_order)
-    matrix, free = set_up(len(data.classrooms))
-    initial_population(data, matrix, free, filled, groups_empty_space, teachers_empty_space, subjects_order)
+    try:
+        config = Config(seed=args.seed, backend=args.backend, method=args.method, initial=args.initial,
+                        moves=args.moves, n=args.n, sigma=args.sigma, run_times=args.run_times,
+                        max_stagnation=args.max_stagnation, iter_count=args.iterations, temperature=args.temperature,
+                        cooling=args.cooling, schedule=args.schedule, step=args.step, weights=weights,
+                        target_acceptance=args.target_acceptance, final_acceptance=args.final_acceptance,
+                        window=args.window, reheat_after=args.reheat_after, max_reheats=args.max_reheats,
+                        population_size=args.population_size, generations=args.generations,
+                        crossover_rate=args.crossover_rate, mutation_rate=args.mutation_rate,
+                        tournament_size=args.tournament_size, elite=args.elite, time_limit=args.time_limit,
+                        max_evaluations=args.max_evaluations, profile=args.profile)
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        previous = read_solution(args.warm_start) if args.warm_start else None
+    except ValueError as e:
+        parser.error('--warm-start: {}'.format(e))
 
-    total, _, _, _, _ = hard_constraints_cost(matrix, data)
-    print('Initial cost of hard constraints: {}'.format(total))
+    # without a seed classes are shuffled as with seed 0, so the compiled input can still be cached
+    try:
+        data = load_data(args.input, {}, {}, {}, seed=0 if args.seed is None else args.seed, cache_dir=args.cache_dir)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
 
-    evolutionary_algorithm(matrix, data, free, filled, groups_empty_space, teachers_empty_space, subjects_order)
-    print('STATISTICS')
-    show_statistics(matrix, data, subjects_order, groups_empty_space, teachers_empty_space)
-    simulated_hardening(matrix, data, free, filled, groups_empty_space, teachers_empty_space, subjects_order, file)
+    output = args.output or os.path.join('solution_files', 'sol_' + os.path.basename(args.input))
+    if args.progress_file:
+        progress = JsonLinesProgress(args.progress_file)
+    elif args.quiet:
+        progress = no_progress
+    else:
+        progress = PrintProgress()
+    try:
+        result = solve(data, config, progress, previous)
+    finally:
+        if args.progress_file:
+            progress.close()
+
+    if args.show_timetable:
+        print('TIMETABLE AFTER HARDENING')
+        show_timetable(result.matrix)
+    if args.show_statistics:
+        print('STATISTICS AFTER HARDENING')
+        show_statistics(result.matrix, data, result.subjects_order, result.groups_empty_space,
+                        result.teachers_empty_space)
+    if args.format == 'jsonl':
+        write_solution_jsonl(data, result.filled, output, result.statistics)
+    else:
+        write_solution_to_file(result.matrix, data, result.filled, output, result.groups_empty_space,
+                               result.teachers_empty_space, result.subjects_order)
+    if result.stats is not None:
+        if not args.quiet:
+            print(result.stats.summary())
+        result.stats.write(output + '.stats.json')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,349 @@
+class HardConstraintsTracker:
+    """
+    Keeps the cost of hard constraints up to date while classes are moved in the timetable, so that total cost and
+    cost of each class are known without scanning the whole matrix. It is notified about every move through add and
+    remove, each of them costs O(duration) operations.
+    Functions hard_constraints_cost and check_hard_constraints from costs.py compute the same values from scratch and
+    can be used to verify the tracker.
+    """
+
+    def __init__(self, data, filled):
+        """
+        :param data: input data, contains classes, classrooms, teachers and groups
+        :param filled: dictionary where key = index of the class, value = list of fields in matrix
+        """
+        self.data = data
+        # row_teachers: list where index = row, value = dictionary where key = index of the teacher, value = list of
+        # class indexes
+        self.row_teachers = [{} for _ in range(60)]
+        # row_groups: list where index = row, value = dictionary where key = group index, value = list of class indexes
+        self.row_groups = [{} for _ in range(60)]
+        # cost_class: dictionary where key = index of a class, value = number of overlaps the class takes part in
+        self.cost_class = {index: 0 for index in data.classes}
+        self.cost_teachers = 0
+        self.cost_classrooms = 0
+        self.cost_groups = 0
+
+        for index, fields in filled.items():
+            self.add(index, fields)
+
+    @property
+    def total(self):
+        """
+        Total cost of hard constraints, same as the first value returned by hard_constraints_cost.
+        """
+        return self.cost_teachers + self.cost_classrooms + self.cost_groups
+
+    def costs(self):
+        """
+        Returns costs in the same format as hard_constraints_cost. Unlike hard_constraints_cost, an overlap of two
+        classes is added to the cost of both classes.
+        :return: total cost, cost per class, cost of teachers, cost of classrooms, cost of groups
+        """
+        return self.total, self.cost_class, self.cost_teachers, self.cost_classrooms, self.cost_groups
+
+    def overlaps(self):
+        """
+        Returns number of overlaps, same as check_hard_constraints, which counts every overlap from both sides.
+        """
+        return 2 * (self.cost_teachers + self.cost_groups) + self.cost_classrooms
+
+    def conflicts(self, index, fields, ignore=()):
+        """
+        Returns number of overlaps that class with given index would have in given fields (with classes already in
+        those rows and with classrooms), not counting overlaps with itself and with classes in ignore. Takes
+        O(duration) operations, so a move can be evaluated before it is made.
+        """
+        c = self.data.classes[index]
+        cost = 0
+        for row, column in fields:
+            if column not in c.classrooms:
+                cost += 1
+            for other in self.row_teachers[row].get(c.teacher, ()):
+                if other != index and other not in ignore:
+                    cost += 1
+            for group_index in c.groups:
+                for other in self.row_groups[row].get(group_index, ()):
+                    if other != index and other not in ignore:
+                        cost += 1
+        return cost
+
+    def add(self, index, fields):
+        """
+        Registers that class with given index took given fields of the matrix.
+        """
+        c = self.data.classes[index]
+        for row, column in fields:
+            if column not in c.classrooms:
+                self.cost_classrooms += 1
+                self.cost_class[index] += 1
+
+            teachers = self.row_teachers[row].setdefault(c.teacher, [])
+            for other in teachers:
+                self.cost_teachers += 1
+                self.cost_class[index] += 1
+                self.cost_class[other] += 1
+            teachers.append(index)
+
+            for group_index in c.groups:
+                groups = self.row_groups[row].setdefault(group_index, [])
+                for other in groups:
+                    self.cost_groups += 1
+                    self.cost_class[index] += 1
+                    self.cost_class[other] += 1
+                groups.append(index)
+
+    def remove(self, index, fields):
+        """
+        Registers that class with given index left given fields of the matrix.
+        """
+        c = self.data.classes[index]
+        for row, column in fields:
+            if column not in c.classrooms:
+                self.cost_classrooms -= 1
+                self.cost_class[index] -= 1
+
+            teachers = self.row_teachers[row][c.teacher]
+            teachers.remove(index)
+            for other in teachers:
+                self.cost_teachers -= 1
+                self.cost_class[index] -= 1
+                self.cost_class[other] -= 1
+
+            for group_index in c.groups:
+                groups = self.row_groups[row][group_index]
+                groups.remove(index)
+                for other in groups:
+                    self.cost_groups -= 1
+                    self.cost_class[index] -= 1
+                    self.cost_class[other] -= 1
+
+
+class MoveJournal:
+    """
+    Records moves of classes so that they can be reverted (see rollback in scheduler.py) by replaying inverse
+    operations. Memory is proportional to the number of moves made since the journal was last cleared.
+    """
+
+    def __init__(self):
+        # entries: list of ('add', index, fields) and ('remove', index, fields)
+        self.entries = []
+
+    def add(self, index, fields):
+        self.entries.append(('add', index, list(fields)))
+
+    def remove(self, index, fields):
+        self.entries.append(('remove', index, list(fields)))
+
+    def clear(self):
+        self.entries = []
+
+
+class EmptySpace:
+    """
+    Empty space (hours between classes in the same day) of groups or of teachers, maintained incrementally. Every
+    entity has number of classes in each row and a 12-bit mask of occupied hours for each day. Moves only mark the
+    entity as changed, and empty space of changed entities is recomputed from their masks when cost is needed. Like
+    empty_space_groups_cost and empty_space_teachers_cost, the gap between the last two rows of the entity in the week
+    is not counted.
+    """
+
+    def __init__(self, entities):
+        self.num_of_entities = len(entities)
+        # counts: dictionary where key = entity, value = number of its classes in each row
+        self.counts = {entity: [0] * 60 for entity in entities}
+        # masks: dictionary where key = entity, value = bitmask of occupied hours for each day
+        self.masks = {entity: [0] * 5 for entity in entities}
+        # empty: dictionary where key = entity, value = empty space for each day
+        self.empty = {entity: [0] * 5 for entity in entities}
+        self.total = 0
+        # histogram: dictionary where key = empty space in a day, value = number of (entity, day) with it, if not 0
+        self.histogram = {}
+        # entities whose classes moved since the cost was last computed
+        self.changed = set()
+
+    def add(self, entity, rows):
+        counts = self.counts[entity]
+        masks = self.masks[entity]
+        for row in rows:
+            if counts[row] == 0:
+                masks[row // 12] |= 1 << (row % 12)
+            counts[row] += 1
+        self.changed.add(entity)
+
+    def remove(self, entity, rows):
+        counts = self.counts[entity]
+        masks = self.masks[entity]
+        for row in rows:
+            counts[row] -= 1
+            if counts[row] == 0:
+                masks[row // 12] &= ~(1 << (row % 12))
+        self.changed.add(entity)
+
+    def _update(self, entity):
+        masks = self.masks[entity]
+        new = [0] * 5
+        last_day = -1
+        for day in range(5):
+            mask = masks[day]
+            if mask:
+                # hours between the first and the last class that are not occupied
+                new[day] = mask.bit_length() - (mask & -mask).bit_length() + 1 - bin(mask).count('1')
+                last_day = day
+
+        # gap between the last two rows of the week is not counted
+        if last_day != -1:
+            mask = masks[last_day]
+            last = mask.bit_length() - 1
+            rest = mask ^ (1 << last)
+            if self.counts[entity][last_day * 12 + last] == 1 and rest:
+                new[last_day] -= last - rest.bit_length()
+
+        old = self.empty[entity]
+        for day in range(5):
+            if old[day] != new[day]:
+                self.total += new[day] - old[day]
+                self._count(old[day], -1)
+                self._count(new[day], 1)
+        self.empty[entity] = new
+
+    def _count(self, value, change):
+        if value:
+            self.histogram[value] = self.histogram.get(value, 0) + change
+            if self.histogram[value] == 0:
+                del self.histogram[value]
+
+    def cost(self):
+        """
+        :return: total cost, maximum per day, average cost
+        """
+        for entity in self.changed:
+            self._update(entity)
+        self.changed.clear()
+        max_empty = max(self.histogram) if self.histogram else 0
+        return self.total, max_empty, self.total / self.num_of_entities
+
+
+class EmptySpaceTracker:
+    """
+    Keeps empty space of groups and teachers up to date while classes are moved, so that costs returned by
+    empty_space_groups_cost and empty_space_teachers_cost are available in O(1).
+    """
+
+    def __init__(self, data, filled):
+        """
+        :param data: input data, contains classes, classrooms, teachers and groups
+        :param filled: dictionary where key = index of the class, value = list of fields in matrix
+        """
+        self.data = data
+        self.groups = EmptySpace(list(data.groups.values()))
+        self.teachers = EmptySpace(list(data.teachers.values()))
+        for index, fields in filled.items():
+            self.add(index, fields)
+
+    def add(self, index, fields):
+        c = self.data.classes[index]
+        rows = [f[0] for f in fields]
+        for group_index in c.groups:
+            self.groups.add(group_index, rows)
+        self.teachers.add(c.teacher, rows)
+
+    def remove(self, index, fields):
+        c = self.data.classes[index]
+        rows = [f[0] for f in fields]
+        for group_index in c.groups:
+            self.groups.remove(group_index, rows)
+        self.teachers.remove(c.teacher, rows)
+
+
+class FreeHourTracker:
+    """
+    Keeps number of classes in every row of the matrix, so whether there is an hour without classes (see free_hour in
+    costs.py) is known in O(1).
+    """
+
+    def __init__(self, filled, num_of_rows=60):
+        """
+        :param filled: dictionary where key = index of the class, value = list of fields in matrix
+        """
+        # counts: list where index = row, value = number of fields of classes in that row
+        self.counts = [0] * num_of_rows
+        self.free_rows = num_of_rows
+        for index, fields in filled.items():
+            self.add(index, fields)
+
+    def add(self, index, fields):
+        for row, _ in fields:
+            if self.counts[row] == 0:
+                self.free_rows -= 1
+            self.counts[row] += 1
+
+    def remove(self, index, fields):
+        for row, _ in fields:
+            self.counts[row] -= 1
+            if self.counts[row] == 0:
+                self.free_rows += 1
+
+
+class SoftConstraintsTracker:
+    """
+    Keeps terms of the soft constraints cost (see soft_cost_terms in costs.py) up to date while classes are moved, so
+    that the weighted cost takes time proportional to the entities changed since it was last computed. Terms with
+    weight 0 are not computed by cost.
+    """
+
+    def __init__(self, data, filled, subjects_order, weights, num_of_rows=60):
+        """
+        :param weights: dictionary where key = term, value = its weight
+        """
+        self.weights = weights
+        self.empty_space = EmptySpaceTracker(data, filled)
+        self.free_hours = FreeHourTracker(filled, num_of_rows)
+        # violated orders are counted by SubjectsOrder itself
+        self.subjects_order = subjects_order
+
+    def add(self, index, fields):
+        self.empty_space.add(index, fields)
+        self.free_hours.add(index, fields)
+
+    def remove(self, index, fields):
+        self.empty_space.remove(index, fields)
+        self.free_hours.remove(index, fields)
+
+    def terms(self):
+        """
+        Returns all terms, same as soft_cost_terms.
+        """
+        _, groups_max, groups_average = self.empty_space.groups.cost()
+        _, teachers_max, teachers_average = self.empty_space.teachers.cost()
+        violated, total = self.subjects_order.violated, self.subjects_order.total
+        return {
+            'groups': groups_average,
+            'teachers': teachers_average,
+            'max_gap': max(groups_max, teachers_max),
+            'order': violated / total if total else 0.0,
+            'free_hour': 1 if self.free_hours.free_rows == 0 else 0,
+        }
+
+    def cost(self):
+        """
+        Returns weighted sum of terms, same as weighted_soft_cost of the terms.
+        """
+        weights = self.weights
+        cost = 0
+        groups_max = teachers_max = 0
+        if weights.get('groups') or weights.get('max_gap'):
+            _, groups_max, groups_average = self.empty_space.groups.cost()
+            if weights.get('groups'):
+                cost += weights['groups'] * groups_average
+        if weights.get('teachers') or weights.get('max_gap'):
+            _, teachers_max, teachers_average = self.empty_space.teachers.cost()
+            if weights.get('teachers'):
+                cost += weights['teachers'] * teachers_average
+        if weights.get('max_gap'):
+            cost += weights['max_gap'] * max(groups_max, teachers_max)
+        if weights.get('order') and self.subjects_order.total:
+            cost += weights['order'] * self.subjects_order.violated / self.subjects_order.total
+        if weights.get('free_hour') and self.free_hours.free_rows == 0:
+            cost += weights['free_hour']
+        return cost
@@ -1,109 +1,218 @@
+import hashlib
 import json
+import os
+import pickle
 import random
+import sys
 from costs import check_hard_constraints, subjects_order_cost, empty_space_groups_cost, empty_space_teachers_cost, \
-    free_hour
-from model import Class, Classroom, Data
+    free_hour, soft_cost_terms, weighted_soft_cost
+from model import Class, Classroom, Data, FreeFields, SubjectsOrder
 
 
-def load_data(file_path, teachers_empty_space, groups_empty_space, subjects_order):
+# version of the compiled data, cached files of other versions are not used
+CACHE_VERSION = 3
+
+
+def load_data(file_path, teachers_empty_space, groups_empty_space, subjects_order, seed=0, cache_dir=None):
     """
     Loads and processes input data, initialises helper structures.
+    Input is validated and compiled in one pass over the classes, names of groups, teachers and subjects are interned
+    and groups and classrooms of classes are replaced by their indexes. Order of classes is shuffled with given seed, so
+    the same file always gives the same data. If cache_dir is given, compiled data is stored there under the hash of
+    the file, and next loads of the same file skip parsing.
     :param file_path: path to file with input data
-    :param teachers_empty_space: dictionary where key = name of the teacher, values = list of rows where it is in
+    :param teachers_empty_space: dictionary where key = index of the teacher, values = list of rows where it is in
     :param groups_empty_space: dictionary where key = group index, values = list of rows where it is in
-    :param subjects_order: dictionary where key = (name of the subject, index of the group), value = [int, int, int]
-    where ints represent start times (row in matrix) for types of classes P, V and L respectively. If start time is -1
-    it means that that subject does not have that type of class.
+    :param subjects_order: SubjectsOrder, start times of classes of every subject and group by type of class
+    :param seed: seed for shuffling of classes
+    :param cache_dir: directory for cached compiled data
     :return: Data(groups, teachers, classes, classrooms)
     """
-    with open(file_path) as file:
-        data = json.load(file)
+    with open(file_path, 'rb') as file:
+        content = file.read()
+
+    cache_path = None
+    if cache_dir is not None:
+        key = hashlib.sha256(content + '\0{}\0{}'.format(CACHE_VERSION, seed).encode()).hexdigest()
+        cache_path = os.path.join(cache_dir, key + '.pickle')
+        if os.path.exists(cache_path):
+            with open(cache_path, 'rb') as file:
+                data = pickle.load(file)
+            fill_structures(data, teachers_empty_space, groups_empty_space, subjects_order)
+            return data
+
+    try:
+        raw = json.loads(content)
+    except ValueError as e:
+        raise ValueError('{}: invalid JSON: {}'.format(file_path, e))
+    data = compile_data(raw, seed, file_path)
+    fill_structures(data, teachers_empty_space, groups_empty_space, subjects_order)
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # write to temporary file first, so that parallel runs never read a partially written file
+        temporary = '{}.{}.tmp'.format(cache_path, os.getpid())
+        with open(temporary, 'wb') as file:
+            pickle.dump(data, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, cache_path)
+    return data
+
+
+def compile_data(raw, seed=0, source='input'):
+    """
+    Validates input (dictionary with 'Ucionice' and 'Casovi') and compiles it to Data.
+    :param source: name of the input used in error messages
+    """
+    def error(message):
+        raise ValueError('{}: {}'.format(source, message))
+
+    if not isinstance(raw, dict):
+        error('expected object with keys Ucionice and Casovi')
+    for key in ('Ucionice', 'Casovi'):
+        if key not in raw:
+            error('missing key {}'.format(key))
+    if not isinstance(raw['Ucionice'], dict):
+        error('Ucionice: expected object where key = type of classroom, value = list of names')
+    if not isinstance(raw['Casovi'], list) or not raw['Casovi']:
+        error('Casovi: expected non-empty list of classes')
 
-    # classes: dictionary where key = index of a class, value = class
-    classes = {}
     # classrooms: dictionary where key = index, value = classroom name
     classrooms = {}
+    # type_columns: dictionary where key = type of classroom, value = indexes of classrooms of that type
+    type_columns = {}
+    for type, names in raw['Ucionice'].items():
+        if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+            error('Ucionice.{}: expected list of names of classrooms'.format(type))
+        type = sys.intern(type)
+        columns = type_columns.setdefault(type, [])
+        for name in names:
+            columns.append(len(classrooms))
+            classrooms[len(classrooms)] = Classroom(sys.intern(name), type)
+    # classes of the same type share one tuple of classrooms
+    type_columns = {type: tuple(columns) for type, columns in type_columns.items()}
+
     # teachers: dictionary where key = teachers' name, value = index
     teachers = {}
     # groups: dictionary where key = name of the group, value = index
     groups = {}
     class_list = []
+    for i, cl in enumerate(raw['Casovi']):
+        where = 'Casovi[{}]'.format(i)
+        if not isinstance(cl, dict):
+            error('{}: expected object'.format(where))
+        for key in ('Predmet', 'Tip', 'Nastavnik', 'Grupe', 'Ucionica', 'Trajanje'):
+            if key not in cl:
+                error('{}: missing key {}'.format(where, key))
+        for key in ('Predmet', 'Nastavnik'):
+            if not isinstance(cl[key], str) or not cl[key]:
+                error('{}.{}: expected non-empty string'.format(where, key))
+        if cl['Tip'] not in ('P', 'V', 'L'):
+            error('{}.Tip: expected P, V or L, got {!r}'.format(where, cl['Tip']))
+        if not isinstance(cl['Grupe'], list) or not cl['Grupe'] or not all(isinstance(g, str) for g in cl['Grupe']):
+            error('{}.Grupe: expected non-empty list of names of groups'.format(where))
+        if cl['Ucionica'] not in type_columns:
+            error('{}.Ucionica: unknown type of classroom {!r}'.format(where, cl['Ucionica']))
+        if not type_columns[cl['Ucionica']]:
+            error('{}.Ucionica: there is no classroom of type {!r}'.format(where, cl['Ucionica']))
+        duration = cl['Trajanje']
+        if isinstance(duration, bool) or not (isinstance(duration, int) or isinstance(duration, str) and
+                                              duration.isdigit()) or not 1 <= int(duration) <= 12:
+            error('{}.Trajanje: expected number of hours from 1 to 12, got {!r}'.format(where, duration))
+
+        teacher = teachers.setdefault(sys.intern(cl['Nastavnik']), len(teachers))
+        class_groups = set()
+        for group in cl['Grupe']:
+            if group not in groups:
+                groups[sys.intern(group)] = len(groups)
+            class_groups.add(groups[group])
+        class_list.append(Class(sorted(class_groups), teacher, sys.intern(cl['Predmet']), cl['Tip'], int(duration),
+                                type_columns[cl['Ucionica']]))
+
+    # shuffle mostly because of teachers
+    random.Random(seed).shuffle(class_list)
+    # classes: dictionary where key = index of a class, value = class
+    classes = {index: cl for index, cl in enumerate(class_list)}
 
-    for cl in data['Casovi']:
-        new_group = cl['Grupe']
-        new_teacher = cl['Nastavnik']
+    teacher_conflicts, group_conflicts, classroom_masks = compile_conflicts(classes)
+    return Data(groups, teachers, classes, classrooms, teacher_conflicts, group_conflicts, classroom_masks)
 
-        # initialise for empty space of teachers
-        if new_teacher not in teachers_empty_space:
-            teachers_empty_space[new_teacher] = []
 
-        new = Class(new_group, new_teacher, cl['Predmet'], cl['Tip'], cl['Trajanje'], cl['Ucionica'])
-        # add groups
-        for group in new_group:
-            if group not in groups:
-                groups[group] = len(groups)
-                # initialise for empty space of groups
-                groups_empty_space[groups[group]] = []
+def fill_structures(data, teachers_empty_space, groups_empty_space, subjects_order):
+    """
+    Initialises given helper structures for loaded data (see set_up_structures).
+    """
+    new_groups, new_teachers, new_order = set_up_structures(data)
+    teachers_empty_space.update(new_teachers)
+    groups_empty_space.update(new_groups)
+    subjects_order.update(new_order)
 
-        # add teacher
-        if new_teacher not in teachers:
-            teachers[new_teacher] = len(teachers)
-        class_list.append(new)
 
-    # shuffle mostly because of teachers
-    random.shuffle(class_list)
-    # add classrooms
-    for cl in class_list:
-        classes[len(classes)] = cl
-
-    # every class is assigned a list of classrooms he can be in as indexes (later columns of matrix)
-    for type in data['Ucionice']:
-        for name in data['Ucionice'][type]:
-            new = Classroom(name, type)
-            classrooms[len(classrooms)] = new
-
-    # every class has a list of groups marked by its index, same for classrooms
-    for i in classes:
-        cl = classes[i]
-
-        classroom = cl.classrooms
-        index_classrooms = []
-        # add classrooms
-        for index, c in classrooms.items():
-            if c.type == classroom:
-                index_classrooms.append(index)
-        cl.classrooms = index_classrooms
-
-        class_groups = cl.groups
-        index_groups = []
-        for name, index in groups.items():
-            if name in class_groups:
-                # initialise order of subjects
-                if (cl.subject, index) not in subjects_order:
-                    subjects_order[(cl.subject, index)] = [-1, -1, -1]
-                index_groups.append(index)
-        cl.groups = index_groups
-
-    return Data(groups, teachers, classes, classrooms)
+def compile_conflicts(classes):
+    """
+    Precomputes which classes can not be held at the same time, so that checking it later is only a lookup.
+    :param classes: dictionary where key = index of a class, value = class with indexes of groups and classrooms
+    :return: teacher_conflicts, group_conflicts, classroom_masks (see Data)
+    """
+    # classes of every teacher and every group
+    teacher_classes = {}
+    group_classes = {}
+    for index, cl in classes.items():
+        teacher_classes.setdefault(cl.teacher, []).append(index)
+        for group_index in cl.groups:
+            group_classes.setdefault(group_index, []).append(index)
+
+    teacher_conflicts = {}
+    group_conflicts = {}
+    classroom_masks = {}
+    for index, cl in classes.items():
+        teacher_conflicts[index] = set(teacher_classes[cl.teacher])
+        teacher_conflicts[index].discard(index)
+
+        shared = {}
+        for group_index in cl.groups:
+            for other in group_classes[group_index]:
+                if other != index:
+                    shared[other] = shared.get(other, 0) + 1
+        group_conflicts[index] = shared
+
+        mask = 0
+        for column in cl.classrooms:
+            mask |= 1 << column
+        classroom_masks[index] = mask
+
+    return teacher_conflicts, group_conflicts, classroom_masks
 
 
 def set_up(num_of_columns):
     """
-    Sets up the timetable matrix and dictionary that stores free fields from matrix.
+    Sets up the timetable matrix and structure that stores free fields from matrix.
     :param num_of_columns: number of classrooms
     :return: matrix, free
     """
     w, h = num_of_columns, 60                                          # 5 (workdays) * 12 (work hours) = 60
     matrix = [[None for x in range(w)] for y in range(h)]
-    free = []
-
-    # initialise free dict as all the fields from matrix
-    for i in range(len(matrix)):
-        for j in range(len(matrix[i])):
-            free.append((i, j))
+    # initially all the fields from matrix are free
+    free = FreeFields(h, w)
     return matrix, free
 
 
+def set_up_structures(data):
+    """
+    Sets up empty helper structures for already loaded data, the same ones that load_data initialises, so that loaded
+    data can be used for more runs of the algorithm.
+    :return: groups_empty_space, teachers_empty_space, subjects_order
+    """
+    groups_empty_space = {group_index: [] for group_index in data.groups.values()}
+    teachers_empty_space = {}
+    # keys of subjects_order in order of the first class of the subject and group
+    keys = {}
+    for cl in data.classes.values():
+        teachers_empty_space.setdefault(cl.teacher, [])
+        for group_index in cl.groups:
+            keys.setdefault((cl.subject, group_index))
+    return groups_empty_space, teachers_empty_space, SubjectsOrder(keys)
+
+
 def show_timetable(matrix):
     """
     Prints timetable matrix.
@@ -137,55 +246,173 @@ def show_timetable(matrix):
 
 def write_solution_to_file(matrix, data, filled, filepath, groups_empty_space, teachers_empty_space, subjects_order):
     """
-    Writes statistics and schedule to file.
+    Writes statistics and schedule to file, given by path or as an open stream. Text is built first and written at
+    once.
     """
-    f = open('solution_files/sol_' + filepath, 'w')
-
-    f.write('-------------------------- STATISTICS --------------------------\n')
+    lines = ['-------------------------- STATISTICS --------------------------\n']
     cost_hard = check_hard_constraints(matrix, data)
     if cost_hard == 0:
-        f.write('\nHard constraints satisfied: 100.00 %\n')
+        lines.append('\nHard constraints satisfied: 100.00 %\n')
     else:
-        f.write('Hard constraints NOT satisfied, cost: {}\n'.format(cost_hard))
-    f.write('Soft constraints satisfied: {:.02f} %\n\n'.format(subjects_order_cost(subjects_order)))
+        lines.append('Hard constraints NOT satisfied, cost: {}\n'.format(cost_hard))
+    lines.append('Soft constraints satisfied: {:.02f} %\n\n'.format(subjects_order_cost(subjects_order)))
 
     empty_groups, max_empty_group, average_empty_groups = empty_space_groups_cost(groups_empty_space)
-    f.write('TOTAL empty space for all GROUPS and all days: {}\n'.format(empty_groups))
-    f.write('MAX empty space for GROUP in day: {}\n'.format(max_empty_group))
-    f.write('AVERAGE empty space for GROUPS per week: {:.02f}\n\n'.format(average_empty_groups))
+    lines.append('TOTAL empty space for all GROUPS and all days: {}\n'.format(empty_groups))
+    lines.append('MAX empty space for GROUP in day: {}\n'.format(max_empty_group))
+    lines.append('AVERAGE empty space for GROUPS per week: {:.02f}\n\n'.format(average_empty_groups))
 
     empty_teachers, max_empty_teacher, average_empty_teachers = empty_space_teachers_cost(teachers_empty_space)
-    f.write('TOTAL empty space for all TEACHERS and all days: {}\n'.format(empty_teachers))
-    f.write('MAX empty space for TEACHER in day: {}\n'.format(max_empty_teacher))
-    f.write('AVERAGE empty space for TEACHERS per week: {:.02f}\n\n'.format(average_empty_teachers))
+    lines.append('TOTAL empty space for all TEACHERS and all days: {}\n'.format(empty_teachers))
+    lines.append('MAX empty space for TEACHER in day: {}\n'.format(max_empty_teacher))
+    lines.append('AVERAGE empty space for TEACHERS per week: {:.02f}\n\n'.format(average_empty_teachers))
 
     f_hour = free_hour(matrix)
     if f_hour != -1:
-        f.write('Free term -> {}\n'.format(f_hour))
+        lines.append('Free term -> {}\n'.format(f_hour))
     else:
-        f.write('NO hours without classes.\n')
+        lines.append('NO hours without classes.\n')
 
     groups_dict = {}
     for group_name, group_index in data.groups.items():
         if group_index not in groups_dict:
             groups_dict[group_index] = group_name
+    teacher_names = {index: name for name, index in data.teachers.items()}
     days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
     hours = [9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20]
 
-    f.write('\n--------------------------- SCHEDULE ---------------------------')
+    lines.append('\n--------------------------- SCHEDULE ---------------------------')
     for class_index, times in filled.items():
         c = data.classes[class_index]
         groups = ' '
         for g in c.groups:
             groups += groups_dict[g] + ', '
-        f.write('\n\nClass {}\n'.format(class_index))
-        f.write('Teacher: {} \nSubject: {} \nGroups:{} \nType: {} \nDuration: {} hour(s)'
-                .format(c.teacher, c.subject, groups[:len(groups) - 2], c.type, c.duration))
+        lines.append('\n\nClass {}\n'.format(class_index))
+        lines.append('Teacher: {} \nSubject: {} \nGroups:{} \nType: {} \nDuration: {} hour(s)'
+                     .format(teacher_names[c.teacher], c.subject, groups[:len(groups) - 2], c.type, c.duration))
         room = str(data.classrooms[times[0][1]])
-        f.write('\nClassroom: {:2s}\nTime: {}'.format(room[:room.rfind('-')], days[times[0][0] // 12]))
+        lines.append('\nClassroom: {:2s}\nTime: {}'.format(room[:room.rfind('-')], days[times[0][0] // 12]))
         for time in times:
-            f.write(' {}'.format(hours[time[0] % 12]))
-    f.close()
+            lines.append(' {}'.format(hours[time[0] % 12]))
+    _write(filepath, ''.join(lines))
+
+
+def write_solution_jsonl(data, filled, file, statistics=None):
+    """
+    Writes solution in machine-readable format, given by path or as an open stream. The first line is a JSON object
+    with format, version and statistics (e.g. from get_statistics), every next line is a JSON object describing one
+    class and its place: index, subject, type, teacher, groups (names), duration, classroom (name), row and column
+    (start field in matrix). It can be read with read_solution_jsonl.
+    """
+    group_names = {index: name for name, index in data.groups.items()}
+    teacher_names = {index: name for name, index in data.teachers.items()}
+    lines = [json.dumps({'format': 'timetable', 'version': 1, 'statistics': statistics})]
+    for index in sorted(filled):
+        c = data.classes[index]
+        row, column = filled[index][0]
+        lines.append(json.dumps({
+            'index': index,
+            'subject': c.subject,
+            'type': c.type,
+            'teacher': teacher_names[c.teacher],
+            'groups': [group_names[g] for g in c.groups],
+            'duration': c.duration,
+            'classroom': data.classrooms[column].name,
+            'row': row,
+            'column': column,
+        }))
+    lines.append('')
+    _write(file, '\n'.join(lines))
+
+
+def read_solution_jsonl(file):
+    """
+    Reads solution written by write_solution_jsonl from path or open stream.
+    :return: list of placements in the same format as read_solution_file returns (with index and column added) and
+    statistics
+    """
+    if isinstance(file, str):
+        name = file
+        with open(file) as f:
+            lines = f.read().splitlines()
+    else:
+        name = getattr(file, 'name', 'solution')
+        lines = file.read().splitlines()
+    if not lines or not lines[0].strip():
+        raise ValueError('{}: empty solution file'.format(name))
+    try:
+        header = json.loads(lines[0])
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or header.get('format') != 'timetable':
+        raise ValueError('{}: not a timetable solution file, the first line must be its header'.format(name))
+    placements = []
+    for number, line in enumerate(lines[1:], 2):
+        if not line:
+            continue
+        try:
+            placements.append(json.loads(line))
+        except ValueError as e:
+            raise ValueError('{}:{}: invalid JSON: {}'.format(name, number, e))
+    if not placements:
+        raise ValueError('{}: solution file has no classes, only the header'.format(name))
+    return placements, header.get('statistics')
+
+
+def read_solution(file_path):
+    """
+    Reads placements from solution file in either format (text written by write_solution_to_file or JSON lines
+    written by write_solution_jsonl).
+    """
+    with open(file_path) as file:
+        first = file.read(1)
+    if not first:
+        raise ValueError('{}: empty solution file'.format(file_path))
+    if first == '{':
+        return read_solution_jsonl(file_path)[0]
+    return read_solution_file(file_path)
+
+
+def _write(file, text):
+    """
+    Writes text to file given by path or as an open stream.
+    """
+    if isinstance(file, str):
+        with open(file, 'w') as f:
+            f.write(text)
+    else:
+        file.write(text)
+
+
+def read_solution_file(file_path):
+    """
+    Reads schedule from file written by write_solution_to_file. Classes are described by their properties and not by
+    their indexes, because indexes change every time the data is loaded.
+    :return: list of placements, dictionaries with keys subject, type, teacher, groups (list of names), duration,
+    classroom (name) and row (start time of the class)
+    """
+    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+    with open(file_path) as file:
+        text = file.read()
+
+    placements = []
+    schedule = text[text.find('--- SCHEDULE ---'):]
+    for block in schedule.split('\n\nClass ')[1:]:
+        lines = {}
+        for line in block.split('\n')[1:]:
+            key, _, value = line.partition(':')
+            lines[key] = value.strip()
+        time = lines['Time'].split()
+        placements.append({
+            'subject': lines['Subject'],
+            'type': lines['Type'],
+            'teacher': lines['Teacher'],
+            'groups': lines['Groups'].split(', '),
+            'duration': int(lines['Duration'].split()[0]),
+            'classroom': lines['Classroom'],
+            'row': days.index(time[0]) * 12 + int(time[1]) - 9,
+        })
+    return placements
 
 
 def show_statistics(matrix, data, subjects_order, groups_empty_space, teachers_empty_space):
@@ -214,3 +441,27 @@ def show_statistics(matrix, data, subjects_order, groups_empty_space, teachers_e
         print('Free term ->', f_hour)
     else:
         print('NO hours without classes.')
+
+
+def get_statistics(matrix, data, subjects_order, groups_empty_space, teachers_empty_space, weights=None):
+    """
+    Returns statistics that show_statistics prints as dictionary, together with terms of the soft constraints cost
+    (soft_terms, see soft_cost_terms) and, if weights are given, their weighted sum (soft_cost).
+    """
+    empty_groups, max_empty_group, average_empty_groups = empty_space_groups_cost(groups_empty_space)
+    empty_teachers, max_empty_teacher, average_empty_teachers = empty_space_teachers_cost(teachers_empty_space)
+    statistics = {
+        'hard_cost': check_hard_constraints(matrix, data),
+        'soft_satisfied': subjects_order_cost(subjects_order),
+        'groups_total': empty_groups,
+        'groups_max': max_empty_group,
+        'groups_average': average_empty_groups,
+        'teachers_total': empty_teachers,
+        'teachers_max': max_empty_teacher,
+        'teachers_average': average_empty_teachers,
+        'free_hour': free_hour(matrix),
+        'soft_terms': soft_cost_terms(matrix, subjects_order, groups_empty_space, teachers_empty_space),
+    }
+    if weights is not None:
+        statistics['soft_cost'] = weighted_soft_cost(statistics['soft_terms'], weights)
+    return statistics
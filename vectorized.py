@@ -0,0 +1,202 @@
+"""
+Array-backed timetable and vectorized versions of cost functions from costs.py. NumPy is an optional dependency, it is
+needed only when this representation is selected (backend='numpy').
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class ArrayTimetable:
+    """
+    Timetable matrix stored as int32 array where each field has index of the class or -1 if it is empty, together with
+    arrays describing classes: index of the teacher, bitmask of groups (one row per class, one column per group) and
+    allowed classrooms. It can be used as a tracker, so the array stays equal to matrix while classes are moved.
+    All cost methods return the same values as the functions with the same name from costs.py.
+    """
+
+    def __init__(self, data, matrix):
+        """
+        :param data: input data, contains classes, classrooms, teachers and groups
+        :param matrix: timetable matrix, columns are classrooms, rows are times
+        """
+        if np is None:
+            raise ImportError('NumPy is required for the array-backed timetable')
+        num_of_classes = len(data.classes)
+        num_of_columns = len(matrix[0])
+        self.num_of_classes = num_of_classes
+        self.num_of_groups = len(data.groups)
+        self.num_of_teachers = len(data.teachers)
+
+        self.teachers = np.zeros(num_of_classes, dtype=np.int32)
+        self.groups = np.zeros((num_of_classes, self.num_of_groups), dtype=np.int32)
+        self.classrooms = np.zeros((num_of_classes, num_of_columns), dtype=bool)
+        self.teachers[:] = data.class_teachers
+        for index, c in data.classes.items():
+            self.groups[index, list(c.groups)] = 1
+            self.classrooms[index, list(c.classrooms)] = True
+
+        self.matrix = np.array([[-1 if field is None else field for field in row] for row in matrix], dtype=np.int32)
+        # pairs of columns (j, k) with j < k, every pair of fields in a row is checked once
+        self.upper = np.triu(np.ones((num_of_columns, num_of_columns), dtype=bool), 1)
+
+    def add(self, index, fields):
+        for row, column in fields:
+            self.matrix[row, column] = index
+
+    def remove(self, index, fields):
+        for row, column in fields:
+            self.matrix[row, column] = -1
+
+    def _overlaps(self):
+        """
+        Returns for every field of the matrix whether it is outside of allowed classrooms, and number of teacher and
+        group overlaps with fields to the right of it in the same row.
+        """
+        occupied = self.matrix >= 0
+        classes = np.where(occupied, self.matrix, 0)
+        columns = np.arange(self.matrix.shape[1])
+
+        wrong_classroom = occupied & ~self.classrooms[classes, columns]
+        pairs = occupied[:, :, None] & occupied[:, None, :] & self.upper
+
+        teachers = self.teachers[classes]
+        teacher_overlaps = (teachers[:, :, None] == teachers[:, None, :]) & pairs
+
+        groups = self.groups[classes]
+        group_overlaps = np.matmul(groups, groups.transpose(0, 2, 1)) * pairs
+
+        return occupied, wrong_classroom, teacher_overlaps.sum(axis=2), group_overlaps.sum(axis=2)
+
+    def hard_constraints_cost(self):
+        """
+        :return: total cost, cost per class, cost of teachers, cost of classrooms, cost of groups
+        """
+        occupied, wrong_classroom, teacher_overlaps, group_overlaps = self._overlaps()
+        field_cost = wrong_classroom + teacher_overlaps + group_overlaps
+        per_class = np.bincount(self.matrix[occupied], weights=field_cost[occupied], minlength=self.num_of_classes)
+        cost_class = {index: int(cost) for index, cost in enumerate(per_class)}
+
+        cost_classrooms = int(wrong_classroom.sum())
+        cost_teacher = int(teacher_overlaps.sum())
+        cost_group = int(group_overlaps.sum())
+        total_cost = cost_teacher + cost_classrooms + cost_group
+        return total_cost, cost_class, cost_teacher, cost_classrooms, cost_group
+
+    def check_hard_constraints(self):
+        """
+        Returns number of overlaps with classes, classrooms, teachers and groups, every overlap of two classes is
+        counted from both sides.
+        """
+        _, wrong_classroom, teacher_overlaps, group_overlaps = self._overlaps()
+        return int(wrong_classroom.sum()) + 2 * int(teacher_overlaps.sum() + group_overlaps.sum())
+
+    def free_hour(self):
+        """
+        Checks if there is an hour without classes. If so, returns it in format 'day: hour', otherwise -1.
+        """
+        days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+        hours = [9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20]
+
+        empty_rows = np.flatnonzero((self.matrix < 0).all(axis=1))
+        if len(empty_rows) == 0:
+            return -1
+        i = int(empty_rows[0])
+        return '{}: {}'.format(days[i // 12], hours[i % 12])
+
+    def empty_space_groups_cost(self):
+        """
+        :return: total cost, maximum per day, average cost
+        """
+        occupied = self.matrix >= 0
+        counts = (self.groups[np.where(occupied, self.matrix, 0)] * occupied[:, :, None]).sum(axis=1)
+        return _empty_space(counts)
+
+    def empty_space_teachers_cost(self):
+        """
+        :return: total cost, maximum per day, average cost
+        """
+        occupied = self.matrix >= 0
+        rows = np.nonzero(occupied)[0]
+        counts = np.zeros((self.matrix.shape[0], self.num_of_teachers), dtype=np.int32)
+        np.add.at(counts, (rows, self.teachers[self.matrix[occupied]]), 1)
+        return _empty_space(counts)
+
+
+def _empty_space(counts):
+    """
+    Calculates empty space from number of classes each entity (group or teacher) has in each row, the same way as
+    empty_space_groups_cost and empty_space_teachers_cost do from sorted lists of rows. Those functions do not count
+    the gap between the last two rows of the week, so it is not counted here either.
+    :param counts: array of shape (60, number of entities)
+    :return: total cost, maximum per day, average cost
+    """
+    num_of_rows, num_of_entities = counts.shape
+    present = counts > 0
+    per_day = present.reshape(num_of_rows // 12, 12, num_of_entities)
+
+    # gaps in a day are all hours between the first and the last class in which entity has no classes
+    in_day = per_day.sum(axis=1)
+    first = per_day.argmax(axis=1)
+    last = 11 - per_day[:, ::-1].argmax(axis=1)
+    empty_per_day = np.where(in_day > 0, last - first + 1 - in_day, 0)
+
+    # remove the gap between the last two rows of the week
+    rows = np.arange(num_of_rows)[:, None]
+    entities = np.arange(num_of_entities)
+    last_row = num_of_rows - 1 - present[::-1].argmax(axis=0)
+    before_last = present & (rows < last_row)
+    second_row = num_of_rows - 1 - before_last[::-1].argmax(axis=0)
+    skipped = present.any(axis=0) & (counts[last_row, entities] == 1) & before_last.any(axis=0) & \
+        (last_row // 12 == second_row // 12) & (last_row - second_row > 1)
+    np.subtract.at(empty_per_day, (last_row[skipped] // 12, entities[skipped]),
+                   last_row[skipped] - second_row[skipped] - 1)
+
+    cost = int(empty_per_day.sum())
+    max_empty = int(empty_per_day.max(initial=0))
+    return cost, max_empty, cost / num_of_entities
+
+
+def compare_with_python(timetable, matrix, data, groups_empty_space, teachers_empty_space):
+    """
+    Compares results of vectorized cost functions with pure Python ones from costs.py.
+    :return: list of names of functions whose results differ
+    """
+    import costs
+
+    different = []
+    if timetable.hard_constraints_cost() != costs.hard_constraints_cost(matrix, data):
+        different.append('hard_constraints_cost')
+    if timetable.check_hard_constraints() != costs.check_hard_constraints(matrix, data):
+        different.append('check_hard_constraints')
+    if timetable.free_hour() != costs.free_hour(matrix):
+        different.append('free_hour')
+    if timetable.empty_space_groups_cost() != costs.empty_space_groups_cost(groups_empty_space):
+        different.append('empty_space_groups_cost')
+    if timetable.empty_space_teachers_cost() != costs.empty_space_teachers_cost(teachers_empty_space):
+        different.append('empty_space_teachers_cost')
+    return different
+
+
+if __name__ == '__main__':
+    # compare both backends on the test files, on initial timetables and after random moves
+    import os
+    import random
+    from scheduler import initial_population, mutate_ideal_spot
+    from utils import load_data, set_up
+    from model import SubjectsOrder
+
+    for file in sorted(os.listdir('test_files')):
+        filled, subjects_order, groups_empty_space, teachers_empty_space = {}, SubjectsOrder(), {}, {}
+        data = load_data(os.path.join('test_files', file), teachers_empty_space, groups_empty_space, subjects_order)
+        matrix, free = set_up(len(data.classrooms))
+        initial_population(data, matrix, free, filled, groups_empty_space, teachers_empty_space, subjects_order)
+        timetable = ArrayTimetable(data, matrix)
+
+        different = set(compare_with_python(timetable, matrix, data, groups_empty_space, teachers_empty_space))
+        for i in range(100):
+            mutate_ideal_spot(matrix, data, random.randrange(len(data.classes)), free, filled, groups_empty_space,
+                              teachers_empty_space, subjects_order, [timetable])
+            different.update(compare_with_python(timetable, matrix, data, groups_empty_space, teachers_empty_space))
+        print('{}: {}'.format(file, 'identical' if not different else 'DIFFERENT ' + ', '.join(sorted(different))))